@@ -0,0 +1,46 @@
+"""Match audit trail: one JSON line per MatchResult, optionally sampled."""
+import json
+import os
+import zlib
+from dataclasses import asdict
+
+
+class MatchAuditLog:
+    """Buffers MatchResults and appends them to a JSONL file.
+
+    Sampling is by a hash of the sale id, so a sample rate keeps the same sales on every run and in
+    every worker. Each flush is a single write to a file opened with O_APPEND, so workers can share
+    one file without interleaving lines.
+    """
+
+    def __init__(self, path, sample=1.0, buffer_size=1000):
+        self.path = path
+        self.sample = sample
+        self.buffer_size = buffer_size
+        self.written = 0
+        self._lines = []
+
+    @classmethod
+    def truncate(cls, path):
+        """Start a fresh audit file; call once per run, before any worker appends."""
+        open(path, "w").close()
+
+    def add(self, results):
+        for result in results:
+            if self.sample < 1.0 and zlib.crc32(result.sale_id.encode()) / 2**32 >= self.sample:
+                continue
+            self._lines.append(json.dumps(asdict(result), ensure_ascii=False))
+        if len(self._lines) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._lines:
+            return
+        data = ("\n".join(self._lines) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self.written += len(self._lines)
+        self._lines = []
@@ -0,0 +1,74 @@
+"""Response caching for the map endpoints.
+
+cached() looks a value up in the default cache and, on a miss, computes it once however many threads
+ask at the same moment: the first caller runs the query, the others in this process wait for its
+result (SingleFlight). Keys carry DatasetVersion, so rebuilding the profiles makes old entries
+unreachable rather than needing them deleted.
+"""
+import hashlib
+import threading
+
+from django.core.cache import cache
+
+
+class SingleFlight:
+    """Runs fn once per key at a time; callers arriving while it runs wait for and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = SingleFlight()
+
+
+def cache_key(prefix, *parts):
+    """A cache-backend-safe key for any parts with a stable repr."""
+    return f"{prefix}:{hashlib.md5(repr(parts).encode()).hexdigest()}"
+
+
+def cached(key, compute, timeout):
+    """cache.get(key), or compute() once across concurrent callers and store it for timeout seconds."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    def fill():
+        # The flight we just missed may have finished between our get and joining this one.
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, timeout)
+        return value
+
+    return _flights.do(key, fill)
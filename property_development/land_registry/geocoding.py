@@ -0,0 +1,131 @@
+"""Postcode geocoding over HTTP, for deployments without a local centroid table.
+
+HTTPGeocoder talks to any postcodes.io-compatible service: bulk lookups are POSTed to /postcodes
+in batches of up to BULK_LIMIT, several batches in flight at once. Every answer, including "no such
+postcode", is kept in GeocodeCacheEntry for GEOCODER_CACHE_TTL_DAYS, so a rebuild only asks about
+postcodes it hasn't seen recently. Batches that still fail after retrying are not cached.
+
+Run the fake_geocoder command to exercise this offline.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.utils import timezone
+from tqdm import tqdm
+
+from .models import GeocodeCacheEntry
+from .postcodes import normalize_postcode
+
+logger = logging.getLogger("land_registry")
+
+# postcodes.io rejects bulk requests for more than 100 postcodes.
+BULK_LIMIT = 100
+
+# Postcodes per cache read.
+CACHE_CHUNK = 10_000
+
+
+class HTTPGeocoder:
+    def __init__(self, base_url=None, timeout=None, workers=None, ttl_days=None, retries=2):
+        self.base_url = (base_url or settings.GEOCODER_URL).rstrip("/")
+        self.timeout = timeout or settings.GEOCODER_TIMEOUT
+        self.workers = workers or settings.GEOCODER_WORKERS
+        self.ttl = timedelta(days=ttl_days or settings.GEOCODER_CACHE_TTL_DAYS)
+        self.retries = retries
+        self.stats = {"cached": 0, "fetched": 0, "not_found": 0, "failed": 0}
+        self._local = threading.local()
+
+    def lookup(self, postcodes):
+        """Map each distinct postcode (in normalize_postcode form) to a Point, or None if it can't be placed."""
+        wanted = {normalize_postcode(postcode) for postcode in postcodes if postcode}
+        self.evict_expired()
+
+        locations = self.read_cache(wanted)
+        self.stats["cached"] = len(locations)
+        missing = sorted(wanted - locations.keys())
+        if missing:
+            locations.update(self.fetch_all(missing))
+        return locations
+
+    def evict_expired(self):
+        deleted, _ = GeocodeCacheEntry.objects.filter(fetched_at__lt=timezone.now() - self.ttl).delete()
+        if deleted:
+            logger.info("Evicted %s expired geocode cache entries", deleted)
+
+    def read_cache(self, postcodes):
+        locations = {}
+        postcodes = list(postcodes)
+        for start in range(0, len(postcodes), CACHE_CHUNK):
+            chunk = postcodes[start:start + CACHE_CHUNK]
+            entries = GeocodeCacheEntry.objects.filter(postcode__in=chunk).values_list("postcode", "location")
+            locations.update(entries)
+        return locations
+
+    def fetch_all(self, postcodes):
+        """Fetch postcodes from the service concurrently, caching each batch as it lands."""
+        locations = {}
+        batches = [postcodes[start:start + BULK_LIMIT] for start in range(0, len(postcodes), BULK_LIMIT)]
+        with (
+            ThreadPoolExecutor(max_workers=self.workers) as pool,
+            tqdm(total=len(postcodes), desc="Geocoding postcodes", unit="postcode") as progress,
+        ):
+            futures = {pool.submit(self.fetch_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                progress.update(len(batch))
+                try:
+                    found = future.result()
+                except (requests.RequestException, KeyError, ValueError) as e:
+                    self.stats["failed"] += len(batch)
+                    logger.warning("Geocoding failed for %s postcodes from %s: %s", len(batch), batch[0], e)
+                    locations.update(dict.fromkeys(batch))
+                    continue
+                self.stats["fetched"] += len(batch)
+                self.stats["not_found"] += sum(found[postcode] is None for postcode in batch)
+                self.write_cache(found)
+                locations.update(found)
+        return locations
+
+    def fetch_batch(self, batch):
+        """POST one bulk lookup, retrying timeouts and server errors with backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session().post(
+                    f"{self.base_url}/postcodes", json={"postcodes": batch}, timeout=self.timeout
+                )
+                response.raise_for_status()
+                return self.parse(batch, response.json())
+            except requests.RequestException as e:
+                retryable = e.response is None or e.response.status_code >= 500 or e.response.status_code == 429
+                if attempt == self.retries or not retryable:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+    def parse(self, batch, payload):
+        found = dict.fromkeys(batch)
+        for item in payload["result"]:
+            result = item.get("result")
+            if result and result.get("longitude") is not None and result.get("latitude") is not None:
+                found[normalize_postcode(item["query"])] = Point(result["longitude"], result["latitude"], srid=4326)
+        return found
+
+    def write_cache(self, found):
+        now = timezone.now()
+        GeocodeCacheEntry.objects.bulk_create(
+            [GeocodeCacheEntry(postcode=postcode, location=point, fetched_at=now) for postcode, point in found.items()],
+            update_conflicts=True,
+            unique_fields=["postcode"],
+            update_fields=["location", "fetched_at"],
+        )
+
+    def session(self):
+        """One requests.Session (and its connection pool) per worker thread."""
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
@@ -0,0 +1,368 @@
+"""Helpers shared by the Land Registry and EPC import commands."""
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import resource
+import sys
+import zipfile
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from fnmatch import fnmatch
+from itertools import chain
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from tqdm import tqdm
+
+from .matching import EPC_CANDIDATE_FIELDS, normalize_address
+from .models import CurrentEPC, DirtyPostcode, EPCRecord
+
+logger = logging.getLogger("land_registry")
+
+# How many rows pass between progress bar refreshes.
+PROGRESS_EVERY = 4096
+
+# Bytes hashed from each end of a file for its checkpoint fingerprint.
+FINGERPRINT_SAMPLE = 1024 * 1024
+
+# Distinct address texts AddressCache holds before starting over.
+ADDRESS_CACHE_SIZE = 200_000
+
+# CurrentEPC's columns, all copied from EPCRecord.
+CURRENT_EPC_FIELDS = (*EPC_CANDIDATE_FIELDS, "match_key")
+CURRENT_EPC_COLUMNS = ", ".join(CURRENT_EPC_FIELDS)
+
+# Which certificate is current for an address: the latest inspected, undated last, then the lowest lm_key
+# (the same order the exact-key tier in populate_property_profiles ranks certificates by).
+CURRENT_EPC_ORDER = "postcode, full_address, inspection_date DESC NULLS LAST, lm_key"
+
+
+@dataclass(frozen=True)
+class Source:
+    """A CSV on disk, or one CSV member inside a zip archive."""
+
+    path: str
+    member: str | None = None
+
+    def __str__(self):
+        return f"{self.path}!{self.member}" if self.member else self.path
+
+    def size(self):
+        """Bytes the progress bar counts for this source (see CSVStream)."""
+        if self.member:
+            with zipfile.ZipFile(self.path) as archive:
+                return archive.getinfo(self.member).file_size
+        return os.path.getsize(self.path)
+
+
+def list_sources(path, member_pattern="*.csv"):
+    """Expand a file, directory or glob pattern into CSV sources, in path order.
+
+    Zip archives yield every member matching member_pattern. When walking a directory, plain and .gz
+    files are only kept if their name (minus .gz) matches member_pattern as well.
+    """
+    if os.path.isdir(path):
+        found = glob.glob(os.path.join(path, "**", "*"), recursive=True)
+        paths = [p for p in found if os.path.isfile(p) and _wanted(p, member_pattern)]
+    elif glob.has_magic(path):
+        paths = [p for p in glob.glob(path, recursive=True) if os.path.isfile(p)]
+    else:
+        paths = [path]
+
+    sources = []
+    for p in sorted(paths):
+        if not p.lower().endswith(".zip"):
+            sources.append(Source(p))
+            continue
+        with zipfile.ZipFile(p) as archive:
+            sources.extend(
+                Source(p, info.filename)
+                for info in archive.infolist()
+                if not info.is_dir() and fnmatch(info.filename, member_pattern)
+            )
+    return sources
+
+
+def _wanted(path, member_pattern):
+    if path.lower().endswith(".zip"):
+        return True
+    name = path[:-3] if path.lower().endswith(".gz") else path
+    return fnmatch(name, member_pattern)
+
+
+class CSVStream:
+    """Read a plain, gzipped or zipped CSV in one pass, decompressing on the fly.
+
+    Progress is reported in bytes: bytes read from disk for .gz files (the uncompressed size is not
+    known up front), uncompressed bytes for plain files and zip members.
+
+    Pass fieldnames for files published without a header row; if the first row does start with
+    fieldnames[0] it is still treated as a header and skipped. Pass on_progress to receive byte
+    increments instead of drawing a tqdm bar, e.g. to feed a combined bar from worker processes.
+    """
+
+    def __init__(self, source, desc="Importing", encoding="utf-8", fieldnames=None, on_progress=None,
+                 start_offset=0):
+        self.source = source
+        self.start_offset = start_offset
+        self.desc = desc
+        self.on_progress = on_progress
+        self.encoding = encoding
+        self.fieldnames = fieldnames
+        self.header = []
+        self.offset = 0  # uncompressed bytes consumed; between rows this is a record boundary
+        self._handles = []
+
+    def __enter__(self):
+        path = self.source.path
+        if self.source.member:
+            archive = zipfile.ZipFile(path)
+            info = archive.getinfo(self.source.member)
+            self._handles.append(archive)
+            self._stream = archive.open(info)
+            self.total = info.file_size
+            self._position = lambda: self.offset
+        elif path.lower().endswith(".gz"):
+            raw = open(path, "rb")
+            self._handles.append(raw)
+            self._stream = gzip.GzipFile(fileobj=raw)
+            self.total = os.path.getsize(path)
+            self._position = raw.tell
+        else:
+            self._stream = open(path, "rb")
+            self.total = os.path.getsize(path)
+            self._position = lambda: self.offset
+        self._handles.insert(0, self._stream)
+
+        self._reader = csv.reader(self._lines())
+        first = [name.lstrip("\ufeff") for name in next((row for row in self._reader if row), [])]
+        if self.fieldnames and first[:1] != [self.fieldnames[0]]:
+            self.header = list(self.fieldnames)
+            # A resumed stream seeks past this row along with the rest it already imported.
+            if first and self.start_offset == 0:
+                self._reader = chain([first], self._reader)
+        else:
+            self.header = first
+
+        if self.start_offset > self.offset:
+            # Resume from a checkpoint: gzip and zip streams decompress forward to get there.
+            self._stream.seek(self.start_offset)
+            self.offset = self.start_offset
+        return self
+
+    def __exit__(self, *exc_info):
+        for handle in self._handles:
+            handle.close()
+        self._handles = []
+
+    def _lines(self):
+        encoding = self.encoding
+        for line in self._stream:
+            self.offset += len(line)
+            yield line.decode(encoding)
+
+    def rows(self):
+        """Yield each data row as a list of strings; blank lines are skipped, as csv.DictReader does."""
+        bar = None
+        report = self.on_progress
+        if report is None:
+            bar = tqdm(total=self.total, desc=self.desc, unit="B", unit_scale=True, unit_divisor=1024)
+            report = bar.update
+
+        reported = 0
+        try:
+            for n, row in enumerate(self._reader, 1):
+                if row:
+                    yield row
+                if n % PROGRESS_EVERY == 0:
+                    position = self._position()
+                    report(position - reported)
+                    reported = position
+            report(self._position() - reported)
+        finally:
+            if bar is not None:
+                bar.close()
+
+    def indexes(self, names):
+        """Column positions of names in the header, in the order given."""
+        lookup = {name: i for i, name in enumerate(self.header)}
+        missing = [name for name in names if name not in lookup]
+        if missing:
+            raise CommandError(f"{self.source} is missing columns: {', '.join(missing)}")
+        return [lookup[name] for name in names]
+
+
+class AddressCache:
+    """normalize_address for an import, looking each distinct address text up once.
+
+    Addresses repeat heavily in both datasets (repeat sales, re-certified homes, "1, HIGH STREET" in every
+    town). The cache empties itself at max_size so a full-file import runs in flat memory.
+    """
+
+    def __init__(self, max_size=ADDRESS_CACHE_SIZE):
+        self.max_size = max_size
+        self._results = {}
+
+    def normalize(self, text):
+        result = self._results.get(text)
+        if result is None:
+            if len(self._results) >= self.max_size:
+                self._results.clear()
+            result = self._results[text] = normalize_address(text)
+        return result
+
+
+class Checkpoint:
+    """Resume point for one import source, kept as JSON under settings.IMPORT_STATE_DIR.
+
+    The offset is only saved after a batch has committed, so resuming from it never re-applies rows
+    that are already in the database. The fingerprint ties the checkpoint to the file's content: the
+    member CRC for zip archives, otherwise a hash of the size and the first and last MiB, which avoids
+    another full pass over multi-GB files.
+    """
+
+    def __init__(self, command, source):
+        self.source = source
+        key = hashlib.sha1(f"{os.path.abspath(source.path)}!{source.member or ''}".encode()).hexdigest()[:16]
+        self.path = Path(settings.IMPORT_STATE_DIR) / "checkpoints" / f"{command}-{key}.json"
+        self.fingerprint = fingerprint(source)
+
+    def load(self):
+        """The saved state for this source, or None if there is none or the file has changed since."""
+        try:
+            state = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return None
+        if state.get("fingerprint") != self.fingerprint:
+            logger.warning("Ignoring checkpoint for %s: the file has changed since it was written", self.source)
+            return None
+        return state
+
+    def save(self, offset, rows):
+        state = {
+            "source": str(self.source),
+            "fingerprint": self.fingerprint,
+            "offset": offset,
+            "rows": rows,
+            "updated_at": datetime.now(UTC).isoformat(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+def fingerprint(source):
+    if source.member:
+        with zipfile.ZipFile(source.path) as archive:
+            info = archive.getinfo(source.member)
+            return f"zip:{info.file_size}:{info.CRC:08x}"
+
+    size = os.path.getsize(source.path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(source.path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE))
+        if size > FINGERPRINT_SAMPLE:
+            f.seek(max(size - FINGERPRINT_SAMPLE, FINGERPRINT_SAMPLE))
+            digest.update(f.read())
+    return f"sha256:{digest.hexdigest()}"
+
+
+def mark_postcodes_dirty(cursor, select_sql, params=None):
+    """Add every postcode returned by select_sql (one "postcode" column) to the DirtyPostcode set.
+
+    Rows are upserted in postcode order, so concurrent importers marking overlapping postcodes take their
+    row locks in the same order instead of deadlocking. marked_at is refreshed, not ignored: clear_dirty
+    in populate_property_profiles compares it to tell postcodes marked again during a rebuild.
+    """
+    table = connection.ops.quote_name(DirtyPostcode._meta.db_table)
+    cursor.execute(
+        f"INSERT INTO {table} (postcode, marked_at) "
+        f"SELECT DISTINCT postcode, now() FROM ({select_sql}) AS changed WHERE postcode <> '' "
+        f"ORDER BY postcode "
+        f"ON CONFLICT (postcode) DO UPDATE SET marked_at = EXCLUDED.marked_at",
+        params,
+    )
+    return cursor.rowcount
+
+
+def mark_dirty(postcodes):
+    """Add postcodes (any iterable) to the DirtyPostcode set."""
+    postcodes = sorted(set(postcodes))
+    if not postcodes:
+        return 0
+    with connection.cursor() as cursor:
+        return mark_postcodes_dirty(cursor, "SELECT unnest(%s::text[]) AS postcode", [postcodes])
+
+
+def refresh_current_epcs(lm_keys):
+    """Bring CurrentEPC up to date for the addresses of just-upserted certificates; call in the same transaction.
+
+    Besides each certificate's address, the address it was previously current for is recomputed too, in case
+    the re-import corrected it. Two importers can race on one address: each computes the latest certificate it
+    can see, and the conflict clause keeps whichever of the two ranks first.
+    """
+    lm_keys = sorted(set(lm_keys))
+    if not lm_keys:
+        return 0
+    current = connection.ops.quote_name(CurrentEPC._meta.db_table)
+    epc = connection.ops.quote_name(EPCRecord._meta.db_table)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in CURRENT_EPC_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {current} c USING {epc} e WHERE e.lm_key = ANY(%s) "
+            f"AND (c.lm_key = e.lm_key OR (c.postcode = e.postcode AND c.full_address = e.full_address)) "
+            f"RETURNING c.postcode, c.full_address",
+            [lm_keys],
+        )
+        previous = cursor.fetchall()
+        cursor.execute(
+            f"INSERT INTO {current} ({CURRENT_EPC_COLUMNS}) "
+            f"SELECT DISTINCT ON (postcode, full_address) {CURRENT_EPC_COLUMNS} FROM {epc} "
+            f"WHERE (postcode, full_address) IN ("
+            f"SELECT postcode, full_address FROM {epc} WHERE lm_key = ANY(%s) "
+            f"UNION SELECT * FROM unnest(%s::text[], %s::text[])) "
+            f"ORDER BY {CURRENT_EPC_ORDER} "
+            f"ON CONFLICT (postcode, full_address) DO UPDATE SET {updates} "
+            f"WHERE (EXCLUDED.inspection_date IS NOT NULL AND ({current}.inspection_date IS NULL "
+            f"OR EXCLUDED.inspection_date > {current}.inspection_date)) "
+            f"OR (EXCLUDED.inspection_date IS NOT DISTINCT FROM {current}.inspection_date "
+            f"AND EXCLUDED.lm_key <= {current}.lm_key)",
+            [lm_keys, [row[0] for row in previous], [row[1] for row in previous]],
+        )
+        return cursor.rowcount
+
+
+def rebuild_current_epcs():
+    """Recreate CurrentEPC from every EPCRecord; returns the number of addresses."""
+    current = connection.ops.quote_name(CurrentEPC._meta.db_table)
+    epc = connection.ops.quote_name(EPCRecord._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {current}")
+        cursor.execute(
+            f"INSERT INTO {current} ({CURRENT_EPC_COLUMNS}) "
+            f"SELECT DISTINCT ON (postcode, full_address) {CURRENT_EPC_COLUMNS} FROM {epc} "
+            f"ORDER BY {CURRENT_EPC_ORDER}"
+        )
+        return cursor.rowcount
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size of the current process (or its largest finished child), in MiB."""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports ru_maxrss in KiB, macOS in bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def throughput_summary(count, elapsed):
+    rate = count / elapsed if elapsed else 0.0
+    return f"{count} rows in {elapsed:.1f}s ({rate:,.0f} rows/s), peak RSS {peak_rss_mb():,.0f} MiB"
@@ -0,0 +1,89 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from tqdm import tqdm
+
+from land_registry.ingest import rebuild_current_epcs
+from land_registry.matching import epc_match_key, normalize_address, sale_match_key
+from land_registry.models import EPCRecord, LandRegistrySale
+
+logger = logging.getLogger("land_registry")
+
+STAGING_TABLE = "normalized_address_staging"
+
+
+def sale_key(address_clean, postcode):
+    return sale_match_key(postcode, address_clean)
+
+
+def epc_key(address_clean, postcode, address1, address2):
+    return epc_match_key(postcode, address1, address2)
+
+
+# Per model: the columns read besides pk and full_address, and how they and address_clean make the match key.
+MATCH_KEY_SOURCES = {
+    LandRegistrySale: (("postcode",), sale_key),
+    EPCRecord: (("postcode", "address1", "address2"), epc_key),
+}
+
+
+class Command(BaseCommand):
+    help = "Fill address_clean / address_tokens / address_numbers / match_key on existing sales and EPC records"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute every row, not just rows whose address_clean or match_key is still empty.",
+        )
+        parser.add_argument("--batch-size", type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        for model in (LandRegistrySale, EPCRecord):
+            qs = model.objects.exclude(full_address="").exclude(full_address__isnull=True)
+            if not options["all"]:
+                qs = qs.filter(Q(address_clean="") | Q(match_key=""))
+            count = self.backfill(model, qs, options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Normalized {count} {model._meta.verbose_name_plural}"))
+            if model is EPCRecord and count:
+                # CurrentEPC carries its own copy of the normalized columns.
+                with transaction.atomic():
+                    addresses = rebuild_current_epcs()
+                self.stdout.write(f"Rebuilt current certificates for {addresses} addresses")
+
+    def backfill(self, model, qs, batch_size):
+        count = 0
+        batch = []
+        key_fields, match_key = MATCH_KEY_SOURCES[model]
+        rows = qs.order_by().values_list("pk", "full_address", *key_fields).iterator(chunk_size=batch_size)
+        for pk, full_address, *key_values in tqdm(rows, desc=f"Normalizing {model.__name__}", unit="record"):
+            address_clean, address_tokens, address_numbers = normalize_address(full_address)
+            batch.append((pk, address_clean, address_tokens, address_numbers, match_key(address_clean, *key_values)))
+            if len(batch) >= batch_size:
+                count += self.write_batch(model, batch)
+                batch = []
+        if batch:
+            count += self.write_batch(model, batch)
+        return count
+
+    def write_batch(self, model, batch):
+        """COPY computed values into a staging table and apply them with one UPDATE ... FROM."""
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = model._meta.pk.column
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                f"(pk TEXT, address_clean TEXT, address_tokens TEXT[], address_numbers TEXT[], match_key TEXT) "
+                f"ON COMMIT DELETE ROWS"
+            )
+            with cursor.cursor.copy(f"COPY {STAGING_TABLE} FROM STDIN") as copy:
+                for values in batch:
+                    copy.write_row(values)
+            cursor.execute(
+                f"UPDATE {table} t SET address_clean = s.address_clean, "
+                f"address_tokens = s.address_tokens, address_numbers = s.address_numbers, match_key = s.match_key "
+                f"FROM {STAGING_TABLE} s WHERE t.{pk} = s.pk"
+            )
+            return cursor.rowcount
@@ -0,0 +1,218 @@
+import json
+import logging
+import time
+from collections import Counter, namedtuple
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from land_registry.matching import (
+    EPC_CANDIDATE_FIELDS,
+    build_full_address,
+    epc_match_key,
+    latest_certificate,
+    match_postcode,
+    normalize_address,
+    sale_match_key,
+)
+from land_registry.metrics import estimate_bedrooms
+
+logger = logging.getLogger("land_registry")
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / "benchmarks" / "match_corpus.json"
+
+EPCCandidate = namedtuple("EPCCandidate", EPC_CANDIDATE_FIELDS)
+
+TIERS = ("exact", "fuzzy", "levenshtein")
+
+
+class Command(BaseCommand):
+    help = "Score the LR ↔ EPC matcher against a labelled corpus: precision, recall and throughput, offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Labelled corpus JSON file.")
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=50,
+            help="Times to match the whole corpus when measuring throughput (default: 50).",
+        )
+        parser.add_argument("--show-errors", action="store_true", help="List every sale matched wrongly or missed.")
+        parser.add_argument("--min-precision", type=float, help="Fail if precision falls below this (0-1).")
+        parser.add_argument("--min-recall", type=float, help="Fail if recall falls below this (0-1).")
+
+    def handle(self, *args, **options):
+        groups = load_corpus(options["corpus"])
+        n_sales = sum(len(sales) for sales, _ in groups)
+        if not n_sales:
+            raise CommandError(f"No labelled sales in {options['corpus']}")
+
+        # Matching logs every decision at INFO; that's noise here and would dominate the timings.
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            predicted = match_corpus(groups)
+            timings = {}
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                match_corpus(groups, timings)
+            elapsed = time.perf_counter() - started
+        finally:
+            logger.setLevel(level)
+
+        outcome, errors = score(groups, predicted)
+        precision, recall = precision_recall(outcome)
+
+        self.stdout.write(f"Corpus: {n_sales} sales in {len(groups)} postcodes ({options['corpus']})")
+        self.stdout.write(
+            f"Matched correctly {outcome['correct']}, wrong EPC {outcome['wrong']}, "
+            f"matched with no EPC expected {outcome['spurious']}, missed {outcome['missed']}, "
+            f"correctly unmatched {outcome['unmatched']}"
+        )
+        self.stdout.write(f"Precision {precision:.3f}, recall {recall:.3f}")
+        if errors["bedrooms"]:
+            self.stdout.write(self.style.WARNING(f"Bedroom estimates off the label for {len(errors['bedrooms'])} EPCs"))
+
+        if options["repeat"]:
+            total = n_sales * options["repeat"]
+            self.stdout.write(f"Throughput: {total / elapsed:,.0f} sales/s over {options['repeat']} passes")
+            for tier in TIERS:
+                seconds = timings.get(tier, 0.0)
+                self.stdout.write(f"  {tier:<12} {seconds * 1e6 / total:8.1f} µs/sale ({seconds:.3f}s)")
+
+        if options["show_errors"]:
+            for line in errors["matches"] + errors["bedrooms"]:
+                self.stdout.write(f"  {line}")
+
+        failures = []
+        if options["min_precision"] is not None and precision < options["min_precision"]:
+            failures.append(f"precision {precision:.3f} < {options['min_precision']}")
+        if options["min_recall"] is not None and recall < options["min_recall"]:
+            failures.append(f"recall {recall:.3f} < {options['min_recall']}")
+        if failures:
+            raise CommandError("Matching regressed: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
+
+
+
+def match_corpus(groups, timings=None):
+    """Match every corpus postcode the way populate_property_profiles does; {sale id: lm_key or None}."""
+    predicted = {}
+    for sales, candidates in groups:
+        exact_join(sales, candidates)
+        matches = match_postcode(sales, candidates, workers=1, timings=timings)
+        for sale, epc in zip(sales, matches, strict=True):
+            predicted[sale.pk] = epc.lm_key if epc else None
+    return predicted
+
+
+def load_corpus(path):
+    """Parse the corpus into [(sales, candidates)] per postcode, deriving the columns the importers would."""
+    try:
+        with open(path) as f:
+            corpus = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CommandError(f"Can't read corpus {path}: {e}") from e
+
+    groups = []
+    for group in corpus["postcodes"]:
+        postcode = group["postcode"]
+        candidates = []
+        for epc in group["epcs"]:
+            full_address = ", ".join(filter(None, (epc.get(f"address{n}") for n in (1, 2, 3))))
+            inspection_date = epc.get("inspection_date")
+            candidates.append(EPCCandidate(
+                epc["lm_key"],
+                full_address,
+                postcode,
+                epc.get("property_type"),
+                date.fromisoformat(inspection_date) if inspection_date else None,
+                epc.get("total_floor_area"),
+                epc.get("number_habitable_rooms"),
+                *normalize_address(full_address),
+            ))
+            # Kept beside the candidate rather than in it, so the tuples stay exactly EPC_CANDIDATE_FIELDS.
+            epc["match_key"] = epc_match_key(postcode, epc.get("address1"), epc.get("address2"))
+        # Only the latest certificate per address, as CurrentEPC holds.
+        addresses = {epc.full_address for epc in candidates}
+        candidates = sorted(
+            (latest_certificate(candidates, address) for address in addresses), key=lambda epc: epc.lm_key
+        )
+
+        sales = []
+        for sale in group["sales"]:
+            full_address = build_full_address(sale["saon"], sale["paon"], sale["street"])
+            clean, tokens, numbers = normalize_address(full_address)
+            sales.append(SimpleNamespace(
+                pk=sale["id"],
+                postcode=postcode,
+                full_address=full_address,
+                address_clean=clean,
+                address_tokens=tokens,
+                address_numbers=numbers,
+                match_key=sale_match_key(postcode, clean),
+                expected=sale["expected"],
+            ))
+        groups.append((sales, EPCList(candidates, group["epcs"])))
+    return groups
+
+
+class EPCList(list):
+    """A postcode's candidates, plus the corpus entries they came from (for match keys and bedroom labels)."""
+
+    def __init__(self, candidates, entries):
+        super().__init__(candidates)
+        self.entries = {entry["lm_key"]: entry for entry in entries}
+
+
+def exact_join(sales, candidates):
+    """Set exact_epc on each sale as latest_sales' subquery would: the latest EPC sharing its match_key."""
+    latest = {}
+    for epc in sorted(candidates, key=lambda epc: epc.lm_key):
+        key = candidates.entries[epc.lm_key]["match_key"]
+        if not key:
+            continue
+        current = latest.get(key)
+        # inspection_date DESC NULLS LAST, then lm_key
+        if current is None or (epc.inspection_date and (not current.inspection_date
+                                                         or epc.inspection_date > current.inspection_date)):
+            latest[key] = epc
+    for sale in sales:
+        epc = latest.get(sale.match_key) if sale.match_key else None
+        sale.exact_epc = epc.lm_key if epc else None
+
+
+def precision_recall(outcome):
+    """(precision, recall) from score()'s outcome counts; a wrong EPC counts against both."""
+    tp, fp, fn = outcome["correct"], outcome["wrong"] + outcome["spurious"], outcome["wrong"] + outcome["missed"]
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall
+
+
+def score(groups, predicted):
+    """Tally predictions against the labels; returns (outcome counts, {"matches": [...], "bedrooms": [...]})."""
+    outcome = Counter(correct=0, wrong=0, spurious=0, missed=0, unmatched=0)
+    errors = {"matches": [], "bedrooms": []}
+    for sales, candidates in groups:
+        for sale in sales:
+            got, want = predicted[sale.pk], sale.expected
+            if want is None:
+                kind = "unmatched" if got is None else "spurious"
+            elif got is None:
+                kind = "missed"
+            else:
+                kind = "correct" if got == want else "wrong"
+            outcome[kind] += 1
+            if kind not in ("correct", "unmatched"):
+                errors["matches"].append(f"{kind}: {sale.pk} '{sale.full_address}' → {got} (expected {want})")
+
+        for epc in candidates:
+            label = candidates.entries[epc.lm_key].get("bedrooms")
+            if label is not None and estimate_bedrooms(epc) != label:
+                errors["bedrooms"].append(
+                    f"bedrooms: {epc.lm_key} estimated {estimate_bedrooms(epc)} (labelled {label})"
+                )
+    return outcome, errors
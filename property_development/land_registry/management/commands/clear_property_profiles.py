@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from land_registry.models import PropertyProfile
+from land_registry.models import DatasetVersion, MapPoint, PropertyProfile
 
 
 class Command(BaseCommand):
@@ -8,4 +8,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
         count, _ = PropertyProfile.objects.all().delete()
+        MapPoint.refresh()
+        DatasetVersion.bump(DatasetVersion.PROPERTY_PROFILES)
         self.stdout.write(self.style.SUCCESS(f"Deleted {count} PropertyProfile records."))
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from django.core.management.base import BaseCommand
+
+from land_registry.geocoding import BULK_LIMIT
+from land_registry.postcodes import normalize_postcode
+
+# Fake coordinates land inside this (west, south, east, north) box, roughly Great Britain.
+BOUNDS = (-5.5, 50.0, 1.7, 55.8)
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the postcodes.io lookup API, for testing HTTP geocoding offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.05, help="Seconds to wait before each response.")
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests answered with a 500 error (default: 0).",
+        )
+        parser.add_argument(
+            "--missing-rate",
+            type=float,
+            default=0.01,
+            help="Fraction of postcodes the fake doesn't know (default: 0.01); the same ones on every run.",
+        )
+
+    def handle(self, *args, **options):
+        stats = {"requests": 0, "postcodes": 0, "failures": 0}
+        lock = threading.Lock()
+
+        class Handler(FakeGeocoderHandler):
+            latency = options["latency"]
+            failure_rate = options["failure_rate"]
+            missing_rate = options["missing_rate"]
+
+            def count(self, postcodes=0, failed=False):
+                with lock:
+                    stats["requests"] += 1
+                    stats["postcodes"] += postcodes
+                    stats["failures"] += failed
+
+        server = ThreadingHTTPServer((options["host"], options["port"]), Handler)
+        self.stdout.write(f"Fake geocoder listening on http://{options['host']}:{options['port']} (Ctrl+C to stop)")
+        self.stdout.write(f"Point populate_property_profiles at it with GEOCODER_URL=http://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Served {stats['requests']} requests for {stats['postcodes']} postcodes ({stats['failures']} failed)"
+        ))
+
+
+class FakeGeocoderHandler(BaseHTTPRequestHandler):
+    """Answers GET /postcodes/<postcode> and bulk POST /postcodes in the postcodes.io response shape."""
+
+    latency = 0.0
+    failure_rate = 0.0
+    missing_rate = 0.0
+
+    def count(self, postcodes=0, failed=False):
+        pass
+
+    def do_GET(self):
+        if not self.path.startswith("/postcodes/"):
+            return self.reply(404, {"status": 404, "error": "Resource not found"})
+        postcode = unquote(self.path.removeprefix("/postcodes/"))
+        if self.fail(1):
+            return
+        result = self.lookup(postcode)
+        if result is None:
+            return self.reply(404, {"status": 404, "error": "Postcode not found"})
+        self.reply(200, {"status": 200, "result": result})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/postcodes":
+            return self.reply(404, {"status": 404, "error": "Resource not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            postcodes = json.loads(self.rfile.read(length))["postcodes"]
+        except (ValueError, KeyError, TypeError):
+            return self.reply(400, {"status": 400, "error": "Invalid JSON submitted"})
+        if len(postcodes) > BULK_LIMIT:
+            return self.reply(400, {"status": 400, "error": f"No more than {BULK_LIMIT} postcodes per request"})
+        if self.fail(len(postcodes)):
+            return
+        results = [{"query": postcode, "result": self.lookup(postcode)} for postcode in postcodes]
+        self.reply(200, {"status": 200, "result": results})
+
+    def fail(self, postcodes):
+        """Sleep for the configured latency, then maybe answer with an error; True if we did."""
+        time.sleep(self.latency)
+        failed = random.random() < self.failure_rate
+        self.count(postcodes, failed)
+        if failed:
+            self.reply(500, {"status": 500, "error": "Injected failure"})
+        return failed
+
+    def lookup(self, postcode):
+        """A stable fake location per postcode, or None for the missing_rate share of postcodes."""
+        postcode = normalize_postcode(postcode)
+        digest = hashlib.sha1(postcode.encode()).digest()
+        if int.from_bytes(digest[:4]) / 2**32 < self.missing_rate:
+            return None
+        west, south, east, north = BOUNDS
+        return {
+            "postcode": postcode,
+            "longitude": round(west + (east - west) * int.from_bytes(digest[4:8]) / 2**32, 6),
+            "latitude": round(south + (north - south) * int.from_bytes(digest[8:12]) / 2**32, 6),
+        }
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up waiting, which is what --latency is for
+
+    def log_message(self, format, *args):
+        pass
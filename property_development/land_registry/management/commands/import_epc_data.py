@@ -1,50 +1,204 @@
-import csv
 import logging
+import resource
+import time
 from datetime import datetime
+from operator import itemgetter
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from tqdm import tqdm
 
+from land_registry.ingest import (
+    AddressCache,
+    Checkpoint,
+    CSVStream,
+    list_sources,
+    mark_dirty,
+    peak_rss_mb,
+    refresh_current_epcs,
+    throughput_summary,
+)
+from land_registry.matching import epc_match_key, normalize_address
 from land_registry.models import EPCRecord
+from land_registry.workers import report_progress, run_pool
 
 logger = logging.getLogger('land_registry')
 
+# EPCRecord fields in the order parse_row() emits them; lm_key first.
+EPC_FIELDS = (
+    "lm_key", "address1", "address2", "address3", "postcode", "property_type", "built_form",
+    "inspection_date", "total_floor_area", "number_habitable_rooms", "number_heated_rooms", "uprn",
+    "full_address", "address_clean", "address_tokens", "address_numbers", "match_key",
+)
+
+# CSV headers feeding EPC_FIELDS, position for position (the address_* fields are derived from ADDRESS,
+# match_key from ADDRESS1/ADDRESS2 and POSTCODE).
+EPC_CSV_COLUMNS = (
+    "LMK_KEY", "ADDRESS1", "ADDRESS2", "ADDRESS3", "POSTCODE", "PROPERTY_TYPE", "BUILT_FORM",
+    "INSPECTION_DATE", "TOTAL_FLOOR_AREA", "NUMBER_HABITABLE_ROOMS", "NUMBER_HEATED_ROOMS", "UPRN",
+    "ADDRESS",
+)
+
 class Command(BaseCommand):
     help = "Import EPC data from CSV"
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_path', type=str)
+        parser.add_argument(
+            'csv_path',
+            type=str,
+            help="A .csv, .csv.gz or EPC bulk-download .zip file, a directory of them, or a glob pattern.",
+        )
+        parser.add_argument(
+            '--member',
+            default="*certificates*.csv",
+            help="Glob selecting the CSVs to read inside zip archives and directories "
+                 "(default: *certificates*.csv).",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help="Rows per bulk upsert; each batch is written in its own transaction (default: 5000).",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Import files in parallel across this many processes, each with its own DB connection.",
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help="Continue each file from the last batch committed before a crash.",
+        )
 
     def handle(self, *args, **kwargs):
-        path = kwargs['csv_path']
-        count = 0
-        total = self.get_line_count(path)
-        with open(path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in tqdm(reader, total=total, desc="Importing EPC Records", unit="record"):
-                EPCRecord.objects.update_or_create(
-                    lm_key=row["LMK_KEY"],
-                    defaults={
-                        "address1": row["ADDRESS1"],
-                        "address2": row["ADDRESS2"],
-                        "address3": row["ADDRESS3"],
-                        "postcode": row["POSTCODE"],
-                        "property_type": row["PROPERTY_TYPE"],
-                        "built_form": row["BUILT_FORM"],
-                        "inspection_date": parse_date_safe(row["INSPECTION_DATE"]),
-                        "total_floor_area": parse_float(row["TOTAL_FLOOR_AREA"]),
-                        "number_habitable_rooms": parse_int(row["NUMBER_HABITABLE_ROOMS"]),
-                        "number_heated_rooms": parse_int(row["NUMBER_HEATED_ROOMS"]),
-                        "uprn": row["UPRN"],
-                        "full_address": row["ADDRESS"],
-                    }
-                )
-                count += 1
+        sources = list_sources(kwargs['csv_path'], kwargs['member'])
+        if not sources:
+            raise CommandError(f"No EPC CSV files found at {kwargs['csv_path']}")
+
+        started = time.monotonic()
+        if kwargs['workers'] > 1 and len(sources) > 1:
+            results = self.import_parallel(sources, kwargs['batch_size'], kwargs['workers'], kwargs['resume'])
+        else:
+            results = [import_source(source, kwargs['batch_size'], resume=kwargs['resume']) for source in sources]
+        elapsed = time.monotonic() - started
+
+        count = sum(result[1] for result in results)
+        failed = [result for result in results if result[3]]
+        if len(results) > 1:
+            self.write_summary(results)
         self.stdout.write(self.style.SUCCESS(f"Imported {count} EPC records"))
+        self.stdout.write(throughput_summary(count, elapsed))
+        if kwargs['workers'] > 1:
+            self.stdout.write(f"Largest worker peak RSS {peak_rss_mb(resource.RUSAGE_CHILDREN):,.0f} MiB")
+        if failed:
+            raise CommandError(f"{len(failed)} of {len(results)} files failed; see the summary above.")
+
+    def import_parallel(self, sources, batch_size, workers, resume):
+        """Fan sources out to a process pool and draw one progress bar over all of their bytes."""
+        tasks = [(import_source, source, batch_size, True, resume) for source in sources]
+        with tqdm(
+            total=sum(source.size() for source in sources),
+            desc=f"Importing EPC Records ({workers} workers)",
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as bar:
+            results = run_pool(workers, tasks, bar, "files")
+
+        return sorted(results)
+
+    def write_summary(self, results):
+        width = max(len(result[0]) for result in results)
+        self.stdout.write(f"{'file':<{width}}  {'rows':>10}  {'seconds':>8}  {'rows/s':>9}")
+        for name, count, elapsed, error in results:
+            rate = count / elapsed if elapsed else 0.0
+            line = f"{name:<{width}}  {count:>10}  {elapsed:>8.1f}  {rate:>9,.0f}"
+            self.stdout.write(self.style.ERROR(f"{line}  FAILED: {error}") if error else line)
+
+def import_source(source, batch_size, in_worker=False, resume=False):
+    """Import one source and return (name, rows, seconds, error) so a failure doesn't stop the others."""
+    started = time.monotonic()
+    count, error = 0, ""
+    on_progress = report_progress if in_worker else None
+    checkpoint = Checkpoint("import_epc_data", source)
+    state = checkpoint.load() if resume else None
+    start, done = (state["offset"], state["rows"]) if state else (0, 0)
+    if state:
+        logger.info("Resuming %s at byte %s (%s rows already imported)", source, start, done)
+    try:
+        with CSVStream(source, desc="Importing EPC Records", on_progress=on_progress, start_offset=start) as stream:
+            count = import_stream(stream, batch_size, checkpoint, done)
+        checkpoint.clear()
+    except Exception as e:
+        if not in_worker:
+            raise
+        logger.exception("EPC import failed for %s", source)
+        error = str(e)
+    return str(source), count, time.monotonic() - started, error
+
+def import_stream(stream, batch_size, checkpoint=None, done=0):
+    """Upsert every row of an open CSVStream in batches of batch_size, checkpointing after each commit."""
+    pick = itemgetter(*stream.indexes(EPC_CSV_COLUMNS))
+    count = 0
+    # Keyed by lm_key: a repeated key inside one INSERT ... ON CONFLICT would be rejected by Postgres.
+    batch = {}
+    addresses = AddressCache()
+    for row in stream.rows():
+        values = parse_row(pick(row), addresses.normalize)
+        batch[values[0]] = values
+        if len(batch) >= batch_size:
+            count += write_batch(batch.values())
+            batch = {}
+            if checkpoint:
+                checkpoint.save(stream.offset, done + count)
+    if batch:
+        count += write_batch(batch.values())
+    return count
+
+def parse_row(fields, normalize=normalize_address):
+    """Convert the raw EPC_CSV_COLUMNS strings into a tuple ordered like EPC_FIELDS.
+
+    normalize derives the address_* fields; import_stream passes a per-import AddressCache's.
+    """
+    (lm_key, address1, address2, address3, postcode, property_type, built_form,
+     inspection_date, floor_area, habitable_rooms, heated_rooms, uprn, address) = fields
+    return (
+        lm_key,
+        address1,
+        address2,
+        address3,
+        postcode,
+        property_type,
+        built_form,
+        parse_date_safe(inspection_date),
+        parse_float(floor_area),
+        parse_int(habitable_rooms),
+        parse_int(heated_rooms),
+        uprn,
+        address,
+        *normalize(address),
+        epc_match_key(postcode, address1, address2),
+    )
+
+def write_batch(rows):
+    """Upsert one batch of parsed rows in a single transaction and return how many were written.
 
-    def get_line_count(self, file_path):
-        with open(file_path, encoding='utf-8') as f:
-            return sum(1 for _ in f) - 1  # subtract header
+    The batch's postcodes are marked dirty: new or changed certificates can change which EPC a sale matches.
+    CurrentEPC is refreshed for the batch's addresses in the same transaction.
+    """
+    records = [EPCRecord(**dict(zip(EPC_FIELDS, values, strict=True))) for values in rows]
+    with transaction.atomic():
+        mark_dirty(record.postcode for record in records)
+        EPCRecord.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=["lm_key"],
+            update_fields=EPC_FIELDS[1:],
+        )
+        refresh_current_epcs(record.lm_key for record in records)
+    return len(records)
 
 def parse_float(val):
     try:
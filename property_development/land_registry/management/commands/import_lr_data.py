@@ -1,22 +1,78 @@
-import csv
 import logging
+import time
 from datetime import datetime
 
-from django.core.management.base import BaseCommand
-from tqdm import tqdm
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from land_registry.models import LandRegistrySale
+from land_registry.ingest import (
+    AddressCache,
+    Checkpoint,
+    CSVStream,
+    list_sources,
+    mark_dirty,
+    mark_postcodes_dirty,
+    throughput_summary,
+)
+from land_registry.matching import build_full_address, normalize_address, sale_match_key
+from land_registry.models import LandRegistrySale, PropertyProfile
 
 logger = logging.getLogger("land_registry")
 
+# Column order used for the COPY staging table in --bulk mode; the CSV supplies all but the derived tail.
+SALE_COLUMNS = (
+    "unique_id", "price_paid", "deed_date", "postcode", "property_type", "new_build", "estate_type",
+    "saon", "paon", "street", "locality", "town", "district", "county", "transaction_category",
+    "full_address", "address_clean", "address_tokens", "address_numbers", "match_key",
+)
+DERIVED_COLUMNS = 5
+
+STAGING_TABLE = "lr_sale_staging"
+DELTA_STAGING_TABLE = "lr_delta_staging"
+
+# HM Land Registry's monthly change file has no header row; columns are published in this order.
+MONTHLY_UPDATE_COLUMNS = (
+    "unique_id", "price_paid", "deed_date", "postcode", "property_type", "new_build", "estate_type",
+    "paon", "saon", "street", "locality", "town", "district", "county", "transaction_category",
+    "record_status",
+)
+
+
 class Command(BaseCommand):
     help = "Import Land Registry Price Paid Data CSV"
 
     def add_arguments(self, parser):
-        parser.add_argument("csv_path", type=str)
+        parser.add_argument("csv_path", type=str, help="A .csv, .csv.gz or .zip file.")
+        parser.add_argument(
+            "--member",
+            default="*.csv",
+            help="Glob selecting the CSV members to read when csv_path is a zip archive (default: *.csv).",
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="COPY rows into a temporary staging table and merge them with one upsert per batch.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Rows per COPY + merge transaction in --bulk and --delta modes (default: 100000).",
+        )
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help="Apply a monthly change file: A/C records are upserted, D records deleted (with the profiles "
+                 "built on them), and every touched postcode is added to the dirty set for profile rebuilding.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue --bulk or --delta imports from the last batch committed before a crash.",
+        )
 
     def parse_deed_date(self, date_str):
-        """Parse date from CSV, handling DD/MM/YYYY and YYYY-MM-DD."""
+        """Parse date from CSV, handling DD/MM/YYYY, YYYY-MM-DD and YYYY-MM-DD HH:MM."""
         if not date_str:
             return None
 
@@ -34,52 +90,247 @@ class Command(BaseCommand):
         except ValueError:
             pass
 
+        # Try YYYY-MM-DD HH:MM (monthly change files)
+        try:
+            return datetime.strptime(date_str, "%Y-%m-%d %H:%M").date()
+        except ValueError:
+            pass
+
         # Still invalid
         return None
 
     def handle(self, *args, **kwargs):
-        path = kwargs["csv_path"]
+        if kwargs["resume"] and not (kwargs["bulk"] or kwargs["delta"]):
+            raise CommandError("--resume needs --bulk or --delta; per-row imports are not checkpointed.")
+
+        if kwargs["delta"]:
+            return self.handle_delta(kwargs["csv_path"], kwargs["member"], kwargs["batch_size"], kwargs["resume"])
+
         count = 0
-        total = self.get_line_count(path)
-
-        with open(path, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-
-            for row in tqdm(reader, total=total, desc="Importing LR Sales", unit="record"):
-                deed_date = self.parse_deed_date(row.get("deed_date", ""))
-
-                if not deed_date:
-                    logger.warning(f"Invalid deed_date '{row.get('deed_date')}' for {row.get('unique_id')}")
-                    continue  # Or set to a placeholder if you want
-
-                LandRegistrySale.objects.update_or_create(
-                    unique_id=row["unique_id"],
-                    defaults={
-                        "price_paid": int(row["price_paid"]),
-                        "deed_date": deed_date,
-                        "postcode": row["postcode"],
-                        "property_type": row["property_type"],
-                        "new_build": row["new_build"],
-                        "estate_type": row["estate_type"],
-                        "saon": row["saon"],
-                        "paon": row["paon"],
-                        "street": row["street"],
-                        "locality": row["locality"],
-                        "town": row["town"],
-                        "district": row["district"],
-                        "county": row["county"],
-                        "transaction_category": row["transaction_category"],
-                        "full_address": ", ".join(filter(None, [
-                            row.get("saon", "").strip(),
-                            row.get("paon", "").strip(),
-                            row.get("street", "").strip(),
-                        ])),
-                    },
-                )
-                count += 1
+        started = time.monotonic()
+        for source in list_sources(kwargs["csv_path"], kwargs["member"]):
+            if kwargs["bulk"]:
+                count += self.bulk_source(source, kwargs["batch_size"], self.copy_and_merge, kwargs["resume"])
+                continue
+            with CSVStream(source, desc="Importing LR Sales") as stream:
+                count += self.row_import(stream)
 
         self.stdout.write(self.style.SUCCESS(f"Imported {count} records"))
+        self.stdout.write(throughput_summary(count, time.monotonic() - started))
+
+    def handle_delta(self, path, member, batch_size, resume):
+        totals = {"A": 0, "C": 0, "D": 0}
+        started = time.monotonic()
+
+        def apply(batch):
+            applied = self.copy_and_apply_delta(batch)
+            for status, n in applied.items():
+                totals[status] = totals.get(status, 0) + n
+            return sum(applied.values())
+
+        for source in list_sources(path, member):
+            self.bulk_source(source, batch_size, apply, resume, delta=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Applied {totals['A']} additions, {totals['C']} changes and {totals['D']} deletions"
+        ))
+        self.stdout.write(throughput_summary(sum(totals.values()), time.monotonic() - started))
+
+    def bulk_source(self, source, batch_size, merge, resume, delta=False):
+        """Run bulk_import over one source with a checkpoint, resuming from it if asked."""
+        checkpoint = Checkpoint("import_lr_data", source)
+        state = checkpoint.load() if resume else None
+        start, done = (state["offset"], state["rows"]) if state else (0, 0)
+        if state:
+            self.stdout.write(f"Resuming {source} at byte {start:,} ({done} rows already imported)")
+
+        desc = "Applying LR changes" if delta else "Importing LR Sales"
+        fieldnames = MONTHLY_UPDATE_COLUMNS if delta else None
+        with CSVStream(source, desc=desc, fieldnames=fieldnames, start_offset=start) as stream:
+            count = self.bulk_import(stream, batch_size, merge, delta, checkpoint, done)
+
+        checkpoint.clear()
+        return count
+
+    def row_import(self, stream):
+        count = 0
+        header = stream.header
+        touched = set()
+
+        for values in stream.rows():
+            row = dict(zip(header, values, strict=False))
+            deed_date = self.parse_deed_date(row.get("deed_date", ""))
+
+            if not deed_date:
+                logger.warning(f"Invalid deed_date '{row.get('deed_date')}' for {row.get('unique_id')}")
+                continue  # Or set to a placeholder if you want
+
+            full_address = build_full_address(row.get("saon"), row.get("paon"), row.get("street"))
+            address_clean, address_tokens, address_numbers = normalize_address(full_address)
+
+            LandRegistrySale.objects.update_or_create(
+                unique_id=row["unique_id"],
+                defaults={
+                    "price_paid": int(row["price_paid"]),
+                    "deed_date": deed_date,
+                    "postcode": row["postcode"],
+                    "property_type": row["property_type"],
+                    "new_build": row["new_build"],
+                    "estate_type": row["estate_type"],
+                    "saon": row["saon"],
+                    "paon": row["paon"],
+                    "street": row["street"],
+                    "locality": row["locality"],
+                    "town": row["town"],
+                    "district": row["district"],
+                    "county": row["county"],
+                    "transaction_category": row["transaction_category"],
+                    "full_address": full_address,
+                    "address_clean": address_clean,
+                    "address_tokens": address_tokens,
+                    "address_numbers": address_numbers,
+                    "match_key": sale_match_key(row["postcode"], address_clean),
+                },
+            )
+            touched.add(row["postcode"])
+            count += 1
+
+        mark_dirty(touched)
+        return count
+
+    def bulk_import(self, stream, batch_size, merge, delta=False, checkpoint=None, done=0):
+        """Stream rows into batches for a COPY-based merge function; delta rows carry their record status.
+
+        After each batch commits, the checkpoint records the stream offset and the running row total.
+        """
+        count = 0
+        # Deed dates and addresses repeat heavily across a Price Paid file, so parse each distinct string once.
+        parsed_dates = {}
+        addresses = AddressCache()
+
+        source_columns = stream.indexes(SALE_COLUMNS[:-DERIVED_COLUMNS])
+        i_id, i_date, i_postcode, i_saon, i_paon, i_street = stream.indexes(
+            ("unique_id", "deed_date", "postcode", "saon", "paon", "street")
+        )
+        i_status = stream.indexes(("record_status",))[0] if delta else None
+
+        batch = []
+        for row in stream.rows():
+            raw_date = row[i_date]
+            deed_date = parsed_dates.get(raw_date)
+            if deed_date is None:
+                deed_date = parsed_dates[raw_date] = self.parse_deed_date(raw_date) or False
+
+            if not deed_date:
+                logger.warning("Invalid deed_date '%s' for %s", raw_date, row[i_id])
+                continue
+
+            values = [row[i] for i in source_columns]
+            values[2] = deed_date
+            full_address = build_full_address(row[i_saon], row[i_paon], row[i_street])
+            address_clean, address_tokens, address_numbers = addresses.normalize(full_address)
+            values.extend((full_address, address_clean, address_tokens, address_numbers))
+            values.append(sale_match_key(row[i_postcode], address_clean))
+            if delta:
+                values.append(row[i_status].strip().upper())
+            batch.append(values)
+
+            if len(batch) >= batch_size:
+                count += merge(batch)
+                batch = []
+                if checkpoint:
+                    checkpoint.save(stream.offset, done + count)
+
+        if batch:
+            count += merge(batch)
+
+        return count
+
+    def copy_and_merge(self, batch):
+        """COPY one batch into the staging table, then upsert it into the sales table in a single statement."""
+        table = connection.ops.quote_name(LandRegistrySale._meta.db_table)
+        columns = ", ".join(SALE_COLUMNS)
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in SALE_COLUMNS[1:])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # ON COMMIT DELETE ROWS keeps one staging table per session, emptied after every batch.
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                f"(LIKE {table}, seq BIGSERIAL) ON COMMIT DELETE ROWS"
+            )
+            with cursor.cursor.copy(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN") as copy:
+                for values in batch:
+                    copy.write_row(values)
+
+            # New postcodes, and the previous postcode of any sale whose postcode this batch changes.
+            mark_postcodes_dirty(
+                cursor,
+                f"SELECT postcode FROM {STAGING_TABLE} "
+                f"UNION SELECT sale.postcode FROM {table} sale JOIN {STAGING_TABLE} s USING (unique_id) "
+                f"WHERE sale.postcode <> s.postcode",
+            )
+
+            # A file can carry the same unique_id twice; the last occurrence wins, as with update_or_create.
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT DISTINCT ON (unique_id) {columns} FROM {STAGING_TABLE} ORDER BY unique_id, seq DESC "
+                f"ON CONFLICT (unique_id) DO UPDATE SET {updates}"
+            )
+            return cursor.rowcount
+
+    def copy_and_apply_delta(self, batch):
+        """Apply one batch of A/C/D change records with set-based statements and mark the postcodes they touch.
+
+        Returns the number of records applied per status.
+        """
+        table = connection.ops.quote_name(LandRegistrySale._meta.db_table)
+        profiles = connection.ops.quote_name(PropertyProfile._meta.db_table)
+        columns = ", ".join(SALE_COLUMNS)
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in SALE_COLUMNS[1:])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {DELTA_STAGING_TABLE} "
+                f"(LIKE {table}, seq BIGSERIAL, record_status CHAR(1)) ON COMMIT DELETE ROWS"
+            )
+            with cursor.cursor.copy(f"COPY {DELTA_STAGING_TABLE} ({columns}, record_status) FROM STDIN") as copy:
+                for values in batch:
+                    copy.write_row(values)
+
+            # Only the last record for a transaction id counts.
+            cursor.execute(
+                f"DELETE FROM {DELTA_STAGING_TABLE} older USING {DELTA_STAGING_TABLE} newer "
+                f"WHERE older.unique_id = newer.unique_id AND older.seq < newer.seq"
+            )
+
+            # Both the postcode a sale had before this change and the one it has after are dirty.
+            mark_postcodes_dirty(
+                cursor,
+                f"SELECT sale.postcode FROM {table} sale JOIN {DELTA_STAGING_TABLE} d USING (unique_id) "
+                f"UNION SELECT postcode FROM {DELTA_STAGING_TABLE} WHERE record_status IN ('A', 'C')",
+            )
+
+            # Drop the profiles built on a deleted sale, or on a corrected one that no longer has the profile's
+            # address. Their postcodes are dirty, so the next rebuild recreates any address with an older sale.
+            cursor.execute(
+                f"DELETE FROM {profiles} profile USING {DELTA_STAGING_TABLE} d "
+                f"WHERE profile.land_registry_sale_id = d.unique_id AND (d.record_status = 'D' OR "
+                f"(profile.postcode, profile.paon, profile.street) IS DISTINCT FROM (d.postcode, d.paon, d.street))"
+            )
+            cursor.execute(
+                f"DELETE FROM {table} sale USING {DELTA_STAGING_TABLE} d "
+                f"WHERE sale.unique_id = d.unique_id AND d.record_status = 'D'"
+            )
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {columns} FROM {DELTA_STAGING_TABLE} WHERE record_status IN ('A', 'C') "
+                f"ON CONFLICT (unique_id) DO UPDATE SET {updates}"
+            )
+
+            cursor.execute(f"SELECT record_status, count(*) FROM {DELTA_STAGING_TABLE} GROUP BY record_status")
+            applied = dict(cursor.fetchall())
 
-    def get_line_count(self, file_path):
-        with open(file_path, encoding="utf-8") as f:
-            return sum(1 for _ in f) - 1  # minus header
+        unknown = {status: n for status, n in applied.items() if status not in ("A", "C", "D")}
+        if unknown:
+            logger.warning("Ignored change records with unknown status: %s", unknown)
+        return {status: n for status, n in applied.items() if status in ("A", "C", "D")}
@@ -0,0 +1,117 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from land_registry.ingest import CSVStream, list_sources
+from land_registry.models import PostcodeCentroid
+from land_registry.postcodes import normalize_postcode
+
+logger = logging.getLogger("land_registry")
+
+STAGING_TABLE = "postcode_centroid_staging"
+
+# Code-Point Open CSVs have no header row; columns are published in this order.
+CODEPOINT_COLUMNS = (
+    "Postcode", "Positional_quality_indicator", "Eastings", "Northings", "Country_code",
+    "NHS_regional_HA_code", "NHS_HA_code", "Admin_county_code", "Admin_district_code", "Admin_ward_code",
+)
+
+# Per dataset: the columns holding postcode, x and y, the SRID of x/y, the default archive member glob,
+# and whether the files carry their own header.
+FORMATS = {
+    # ONS Postcode Directory: WGS84 lat/long, one national file plus per-area copies we skip.
+    "onspd": {"columns": ("pcds", "long", "lat"), "srid": 4326, "member": "*ONSPD_*_UK.csv", "fieldnames": None},
+    # OS Code-Point Open: British National Grid eastings/northings, one file per postcode area.
+    "codepoint": {
+        "columns": ("Postcode", "Eastings", "Northings"),
+        "srid": 27700,
+        "member": "*Data/CSV/*.csv",
+        "fieldnames": CODEPOINT_COLUMNS,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Import postcode centroids (ONS Postcode Directory or Code-Point Open) for offline geocoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", type=str, help="A .csv, .csv.gz or .zip file, a directory, or a glob.")
+        parser.add_argument("--format", choices=sorted(FORMATS), default="onspd")
+        parser.add_argument(
+            "--member",
+            help="Glob selecting the CSVs to read inside zip archives and directories "
+                 "(default: the national ONSPD file, or every Code-Point Open area file).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Rows per COPY + merge transaction (default: 100000).",
+        )
+
+    def handle(self, *args, **options):
+        spec = FORMATS[options["format"]]
+        sources = list_sources(options["csv_path"], options["member"] or spec["member"])
+        if not sources:
+            raise CommandError(f"No postcode CSV files found at {options['csv_path']}")
+
+        count, skipped = 0, 0
+        for source in sources:
+            with CSVStream(source, desc="Importing postcode centroids", fieldnames=spec["fieldnames"]) as stream:
+                i_postcode, i_x, i_y = stream.indexes(spec["columns"])
+                batch = []
+                for row in stream.rows():
+                    x, y = parse_coordinate(row[i_x]), parse_coordinate(row[i_y])
+                    if not has_location(x, y, spec["srid"]):
+                        skipped += 1
+                        continue
+                    batch.append((normalize_postcode(row[i_postcode]), x, y))
+                    if len(batch) >= options["batch_size"]:
+                        count += self.copy_and_merge(batch, spec["srid"])
+                        batch = []
+                if batch:
+                    count += self.copy_and_merge(batch, spec["srid"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {count} postcode centroids ({skipped} postcodes without coordinates skipped)"
+        ))
+
+    def copy_and_merge(self, batch, srid):
+        """COPY one batch of (postcode, x, y) rows into staging and upsert them as WGS84 points."""
+        table = connection.ops.quote_name(PostcodeCentroid._meta.db_table)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                f"(postcode TEXT, x DOUBLE PRECISION, y DOUBLE PRECISION) ON COMMIT DELETE ROWS"
+            )
+            with cursor.cursor.copy(f"COPY {STAGING_TABLE} (postcode, x, y) FROM STDIN") as copy:
+                for values in batch:
+                    copy.write_row(values)
+            cursor.execute(
+                f"INSERT INTO {table} (postcode, location) "
+                f"SELECT DISTINCT ON (postcode) postcode, ST_Transform(ST_SetSRID(ST_MakePoint(x, y), %s), 4326) "
+                f"FROM {STAGING_TABLE} ORDER BY postcode "
+                f"ON CONFLICT (postcode) DO UPDATE SET location = EXCLUDED.location",
+                [srid],
+            )
+            return cursor.rowcount
+
+
+def parse_coordinate(val):
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return None
+
+
+def has_location(x, y, srid):
+    """False for the placeholders both datasets use when a postcode has no grid reference."""
+    if x is None or y is None:
+        return False
+    if srid == 4326:
+        # ONSPD: lat 99.999999 / long 0.000000
+        return y < 90
+    # Code-Point Open: eastings and northings of 0
+    return x > 0 and y > 0
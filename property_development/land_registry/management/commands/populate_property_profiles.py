@@ -1,258 +1,396 @@
 import logging
-import re
-
-import requests
-from django.contrib.gis.geos import Point
-from django.core.management.base import BaseCommand
-from django.db.models import Max
-from rapidfuzz import fuzz
+import time
+from collections import defaultdict
+from itertools import groupby
+from operator import attrgetter
+
+from django.contrib.gis.db.models import PointField
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from tqdm import tqdm
 
-from land_registry.models import EPCRecord, LandRegistrySale, PropertyProfile
+from land_registry.audit import MatchAuditLog
+from land_registry.geocoding import HTTPGeocoder
+from land_registry.matching import load_epc_candidates, match_postcode
+from land_registry.metrics import estimate_bedrooms, price_per_area
+from land_registry.models import (
+    CurrentEPC,
+    DatasetVersion,
+    DirtyPostcode,
+    LandRegistrySale,
+    MapPoint,
+    PostcodeCentroid,
+    PropertyProfile,
+)
+from land_registry.postcodes import normalize_postcode, outward_code
+from land_registry.workers import report_progress, run_pool
 
 logger = logging.getLogger("land_registry")
 
-class Command(BaseCommand):
-    help = "Create PropertyProfile entries using latest Land Registry + EPC data"
+# PropertyProfile's unique address key, and the fields a rebuild refreshes on an existing profile.
+PROFILE_KEY = ["postcode", "paon", "street"]
+PROFILE_FIELDS = [
+    "land_registry_sale", "epc_record", "estimated_num_bedrooms", "location", "price_per_sq_metre", "price_per_sq_ft",
+]
 
-    COMMON_NOISE_WORDS = [
-    r"\bflat\b", r"\bapartment\b", r"\bapt\b", r"\bunit\b", r"\bthe\b", r"\bhouse\b",
-    r"\bproperty\b", r"\bfarm\b", r"\bbungalow\b", r"\bvilla\b", r"\bold\b"
-    ]
+# The LandRegistrySale fields matching and build_profile read from each latest sale.
+SALE_FIELDS = [
+    "postcode", "paon", "street", "full_address", "address_clean", "address_tokens", "address_numbers", "price_paid",
+]
 
-    ADDRESS_CLEANER = re.compile("|".join(COMMON_NOISE_WORDS), re.IGNORECASE)
 
-    def handle(self, *args, **options):
-        latest_sales = (
-            LandRegistrySale.objects.values("postcode", "paon", "street")
-            .annotate(latest_date=Max("deed_date"))
-        )
+class Command(BaseCommand):
+    help = "Create PropertyProfile entries using latest Land Registry + EPC data"
 
-        count, errors = 0, 0
+    # MatchAuditLog when --match-audit is given; populate() records into it.
+    audit = None
+
+    # Sales fetched per round trip from the server-side cursor.
+    CHUNK_SIZE = 2000
+    # Profiles per bulk upsert.
+    PROFILE_BATCH_SIZE = 2000
+    # Postcodes per latest-sales query (and per dirty-set delete) when rebuilding a selection.
+    POSTCODES_PER_QUERY = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--geocoder",
+            choices=["local", "http"],
+            default="local",
+            help="Place profiles with the PostcodeCentroid table (default), or with the HTTP service at "
+                 "GEOCODER_URL, looking each distinct postcode up once through the geocode cache.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Shard the rebuild by postcode district (outward code) across this many processes, "
+                 "each with its own DB connection.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only rebuild postcodes the importers marked dirty, then clear them from the dirty set.",
+        )
+        parser.add_argument(
+            "--postcode-prefix",
+            action="append",
+            default=[],
+            help="Only rebuild postcodes starting with this prefix, e.g. LL30 or 'LL30 2' (repeatable).",
+        )
+        parser.add_argument(
+            "--match-audit",
+            metavar="PATH",
+            help="Write how every sale was matched (tier, EPC, score, boosts) to this JSONL file.",
+        )
+        parser.add_argument(
+            "--audit-sample",
+            type=float,
+            default=1.0,
+            help="Fraction of sales to include in --match-audit, chosen by sale id (default: 1, all).",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Stop after this many postcodes, for quick runs while tuning the matcher.",
+        )
 
-        for sale_key in tqdm(latest_sales, desc="Processing sales", unit="record"):
-            try:
-                sale = LandRegistrySale.objects.get(
-                    postcode=sale_key["postcode"],
-                    paon=sale_key["paon"],
-                    street=sale_key["street"],
-                    deed_date=sale_key["latest_date"]
-                )
-                # print(f"Processing sale: {sale})")
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        if not 0 < options["audit_sample"] <= 1:
+            raise CommandError("--audit-sample must be above 0 and at most 1")
+
+        self.audit = None
+        if options["match_audit"]:
+            MatchAuditLog.truncate(options["match_audit"])
+            self.audit = MatchAuditLog(options["match_audit"], options["audit_sample"])
+
+        dirty = None
+        if options["incremental"]:
+            dirty = dict(DirtyPostcode.objects.values_list("postcode", "marked_at"))
+            if not dirty:
+                self.stdout.write(self.style.SUCCESS("No dirty postcodes; nothing to rebuild."))
+                return
+        postcodes = self.select_postcodes(dirty, options["postcode_prefix"], options["limit"])
+
+        locations = None
+        if options["geocoder"] == "http":
+            geocoder = HTTPGeocoder()
+            if postcodes is None:
+                locations = geocoder.lookup(self.sale_postcodes().iterator())
+            else:
+                locations = geocoder.lookup(postcodes)
+            self.stdout.write(
+                "Geocoded {cached} postcodes from cache, {fetched} over HTTP "
+                "({not_found} unknown, {failed} failed)".format(**geocoder.stats)
+            )
+        elif not PostcodeCentroid.objects.exists():
+            logger.warning("No postcode centroids loaded; profiles get no location until import_postcode_centroids")
 
-                epc_qs = EPCRecord.objects.filter(postcode=sale.postcode)
-                # print(f"EPCRecords: {epc_qs})")
-                best_epc = self.best_match(epc_qs, sale)
+        if options["workers"] > 1:
+            workers, verbosity = options["workers"], options["verbosity"]
+            count, errors, failed = self.populate_parallel(workers, postcodes, locations, verbosity)
+        else:
+            count, errors, failed = self.populate_serial(postcodes, locations)
 
-                if not best_epc:
-                    logger.warning(f"No EPC match for LR @ {sale.full_address}, {sale.postcode}")
+        self.stdout.write(self.style.SUCCESS(f"Created/Updated {count} profiles. {errors} errors."))
+        if self.audit:
+            self.stdout.write(f"Match audit written to {self.audit.path}")
+
+        if dirty is not None:
+            self.clear_dirty(dirty, postcodes, failed)
+
+        # The map reads the materialized view, and caches its responses per data version.
+        MapPoint.refresh()
+        DatasetVersion.bump(DatasetVersion.PROPERTY_PROFILES)
+
+    def sale_postcodes(self):
+        return LandRegistrySale.objects.order_by("postcode").values_list("postcode", flat=True).distinct()
+
+    def select_postcodes(self, dirty, prefixes, limit):
+        """The postcodes to rebuild, in order, or None for every postcode with a sale."""
+        if dirty is None and not prefixes and not limit:
+            return None
+
+        if dirty is not None:
+            postcodes = sorted(dirty)
+            if prefixes:
+                prefixes = tuple(prefix.upper() for prefix in prefixes)
+                postcodes = [postcode for postcode in postcodes if postcode.startswith(prefixes)]
+        else:
+            selected = self.sale_postcodes()
+            if prefixes:
+                scope = Q()
+                for prefix in prefixes:
+                    scope |= Q(postcode__startswith=prefix.upper())
+                selected = selected.filter(scope)
+            postcodes = list(selected[:limit] if limit else selected)
+
+        return postcodes[:limit] if limit else postcodes
+
+    def clear_dirty(self, dirty, postcodes, failed):
+        """Drop rebuilt postcodes from the dirty set, unless they failed or were marked again meanwhile."""
+        rebuilt = [postcode for postcode in postcodes if postcode not in failed]
+        cleared = 0
+        for start in range(0, len(rebuilt), self.POSTCODES_PER_QUERY):
+            chunk = rebuilt[start:start + self.POSTCODES_PER_QUERY]
+            # Postcodes an import touched after we read the dirty set have a newer marked_at and stay dirty.
+            marked_before = max(dirty[postcode] for postcode in chunk)
+            cleared += DirtyPostcode.objects.filter(postcode__in=chunk, marked_at__lte=marked_before).delete()[0]
+        remaining = DirtyPostcode.objects.count()
+        self.stdout.write(f"Cleared {cleared} dirty postcodes; {remaining} still dirty.")
+
+    def latest_sales(self, postcodes=None, local=True):
+        """One row per (postcode, paon, street): the latest sale, ties broken by unique_id so re-runs agree.
+
+        Ordering by postcode first also delivers the sales grouped by postcode. With local=True each sale
+        carries its postcode's centroid, joined in from PostcodeCentroid; sale postcodes are already in the
+        'OUT IN' form that table is keyed on.
+        """
+        sales = LandRegistrySale.objects.all()
+        if postcodes is not None:
+            sales = sales.filter(postcode__in=postcodes)
+        # A sale is the latest if no other sale of the address is newer. Unlike DISTINCT ON, whose select list
+        # is computed for every historical sale before it discards them, this anti-join filters first, so the
+        # subqueries annotated below only run for the latest sales.
+        newer = LandRegistrySale.objects.filter(
+            Q(deed_date__gt=OuterRef("deed_date"))
+            | Q(deed_date=OuterRef("deed_date"), unique_id__gt=OuterRef("unique_id")),
+            postcode=OuterRef("postcode"), paon=OuterRef("paon"), street=OuterRef("street"),
+        )
+        latest_sales = sales.filter(~Exists(newer)).order_by("postcode", "paon", "street").only(*SALE_FIELDS)
+        # Exact-key tier: the latest EPC whose match_key equals the sale's, resolved in the same query.
+        exact_epc = (
+            CurrentEPC.objects.filter(match_key=OuterRef("match_key"))
+            .exclude(match_key="")
+            .order_by(F("inspection_date").desc(nulls_last=True), "lm_key")
+            .values("lm_key")[:1]
+        )
+        latest_sales = latest_sales.annotate(exact_epc=Subquery(exact_epc))
+        if local:
+            centroid = PostcodeCentroid.objects.filter(postcode=OuterRef("postcode")).values("location")[:1]
+            latest_sales = latest_sales.annotate(centroid=Subquery(centroid, output_field=PointField(srid=4326)))
+        return latest_sales
+
+    def populate(self, latest_sales, locations=None, on_progress=None):
+        """Match and save profiles for latest_sales, one postcode at a time.
+
+        Returns (profiles, errors, postcodes in batches that failed to save). locations maps postcodes to points
+        when geocoding over HTTP; otherwise each sale brings its centroid. Profiles are buffered and upserted
+        PROFILE_BATCH_SIZE at a time.
+        """
+        count, errors, failed = 0, 0, set()
+        buffer = []
+        audit = [] if self.audit else None
+
+        for postcode, sales in groupby(latest_sales.iterator(chunk_size=self.CHUNK_SIZE), key=attrgetter("postcode")):
+            # Loaded once and scored against every sale in the postcode in one matrix.
+            candidates = load_epc_candidates(postcode)
+            sales = list(sales)
+            matches = match_postcode(sales, candidates, audit=audit)
+            if audit:
+                self.audit.add(audit)
+                audit.clear()
+            if locations is not None:
+                location = locations.get(normalize_postcode(postcode))
+                for sale in sales:
+                    sale.centroid = location
+
+            for sale, best_epc in zip(sales, matches, strict=True):
+                try:
+                    profile = self.build_profile(sale, best_epc)
+                except Exception as e:
+                    errors += 1
+                    logger.warning("Error processing sale %s: %s", sale.pk, e)
                     continue
+                if profile:
+                    buffer.append(profile)
 
-                # Use latest inspection date version of matching EPC
-                epc = (
-                    EPCRecord.objects.filter(postcode=sale.postcode, full_address=best_epc.full_address)
-                    .order_by("-inspection_date")
-                    .first()
-                )
+            if len(buffer) >= self.PROFILE_BATCH_SIZE:
+                written, unsaved = self.write_profiles(buffer)
+                count, errors, buffer = count + written, errors + len(buffer) - written, []
+                failed |= unsaved
 
-                if not epc or not epc.total_floor_area:
-                    logger.warning(f"No usable EPC for {sale.full_address} — missing or no floor area.")
-                    continue
+            if on_progress:
+                on_progress(len(sales))
 
-                location = self.geocode_postcode(sale.postcode)
-                floor_area = float(epc.total_floor_area)
-                price = float(sale.price_paid)
-
-                price_per_m2 = round(price / floor_area, 2)
-                price_per_ft2 = round(price / self.convert_sq_m_to_sq_ft(floor_area), 2)
-                estimated_beds = self.estimate_bedrooms(epc)
-
-                PropertyProfile.objects.update_or_create(
-                    postcode=sale.postcode,
-                    paon=sale.paon,
-                    street=sale.street,
-                    defaults={
-                        'land_registry_sale': sale,
-                        'epc_record': epc,
-                        'estimated_num_bedrooms': estimated_beds,
-                        'location': location,
-                        'price_per_sq_metre': price_per_m2,
-                        'price_per_sq_ft': price_per_ft2,
-                    }
-                )
-                count += 1
-            except Exception as e:
-                errors += 1
-                logger.warning(f"Error processing sale {sale_key}: {e}")
-                continue
+        if buffer:
+            written, unsaved = self.write_profiles(buffer)
+            count, errors = count + written, errors + len(buffer) - written
+            failed |= unsaved
+        if self.audit:
+            self.audit.flush()
 
-        self.stdout.write(self.style.SUCCESS(f"Created/Updated {count} profiles. {errors} errors."))
+        return count, errors, failed
 
-    def clean_address(self, text):
-        if not text:
-            return ""
-        text = re.sub(r"[-/]", " ", text)
-        text = self.ADDRESS_CLEANER.sub("", text)
-        text = re.sub(r"[^\w\s]", "", text).lower()
-        return re.sub(r"\s+", " ", text).strip()
-
-    def extract_numbers(self, text):
-        return re.findall(r"\b\d+\b", text)
-
-    def best_match(self, epc_queryset, sale_obj):
-        sale_clean = self.clean_address(sale_obj.full_address)
-        sale_tokens = set(sale_clean.split())
-        sale_numbers = self.extract_numbers(sale_clean)
-        sale_postcode = sale_obj.postcode.replace(" ", "").upper()
-
-        # ---- Fast path: single number + same postcode ---------------------------
-        if len(sale_numbers) == 1:
-            for epc in epc_queryset:
-                epc_clean = self.clean_address(epc.full_address)
-                epc_numbers = self.extract_numbers(epc_clean)
-                epc_postcode = epc.postcode.replace(" ", "").upper()
-
-                if sale_numbers[0] in epc_numbers and sale_postcode == epc_postcode:
-                    logger.info(
-                        "[FastMatch] Number+postcode: LR='%s' ↔ EPC='%s'",
-                        sale_obj.full_address, epc.full_address
-                    )
-                    return epc
-
-        # ---- Fallback: fuzzy + hybrid boosts -----------------------------------
-        best_score = 0.0
-        best_epc = None
-
-        for epc in epc_queryset:
-            epc_clean = self.clean_address(epc.full_address)
-            epc_tokens = set(epc_clean.split())
-            epc_numbers = self.extract_numbers(epc_clean)
-
-            # If LR has exactly one number and EPC doesn't contain it, skip early
-            if len(sale_numbers) == 1 and sale_numbers[0] not in epc_numbers:
-                continue
-
-            base_score = fuzz.token_sort_ratio(sale_clean, epc_clean)
-            score = float(base_score)
-            boost_applied = []
-
-            # Always check token-subset
-            if sale_tokens and sale_tokens.issubset(epc_tokens):
-                score += 15
-                boost_applied.append("token_subset(+15)")
-
-            # Add boost if LR token appears fully in EPC tokens (short-name boost)
-            if any(token in epc_tokens for token in sale_tokens):
-                score += 10
-                boost_applied.append("token_overlap(+10)")
-
-            # Substring and prefix boosts (only if base is halfway plausible)
-            if base_score > 40:
-                if sale_clean in epc_clean:
-                    score += 20
-                    boost_applied.append("substring(+20)")
-                elif epc_clean.startswith(sale_clean):
-                    score += 10
-                    boost_applied.append("prefix(+10)")
-
-            if score > 100:
-                score = 100.0
-
-            logger.info(
-                "Fuzzy score=%.2f (base=%.2f%s) between LR='%s' and EPC='%s' (LR ID=%s, EPC PK=%s)",
-                score,
-                base_score,
-                f", boosts={'+'.join(boost_applied)}" if boost_applied else "",
-                sale_clean,
-                epc_clean,
-                getattr(sale_obj, 'pk', 'Unknown'),
-                getattr(epc, 'pk', 'Unknown'),
+    def write_profiles(self, profiles):
+        """Upsert a batch of profiles on their address key; returns (written, postcodes of a batch that failed)."""
+        try:
+            with transaction.atomic():
+                PropertyProfile.objects.bulk_create(
+                    profiles,
+                    update_conflicts=True,
+                    unique_fields=PROFILE_KEY,
+                    update_fields=PROFILE_FIELDS,
+                )
+        except Exception as e:
+            logger.warning("Error saving %s profiles from %s: %s", len(profiles), profiles[0].postcode, e)
+            return 0, {profile.postcode for profile in profiles}
+        return len(profiles), set()
+
+    def populate_serial(self, postcodes, locations):
+        """Rebuild in this process; returns (profiles, errors, failed postcodes) like populate_parallel.
+
+        A selection of postcodes is queried POSTCODES_PER_QUERY at a time.
+        """
+        if postcodes is None:
+            batches = [self.latest_sales(local=locations is None)]
+        else:
+            batches = (
+                self.latest_sales(postcodes[start:start + self.POSTCODES_PER_QUERY], local=locations is None)
+                for start in range(0, len(postcodes), self.POSTCODES_PER_QUERY)
             )
 
-            if score > best_score:
-                best_score = score
-                best_epc = epc
-
-        if best_epc and best_score >= 70:
-            return best_epc
-
-        # ---- Final fallback: Levenshtein ---------------------------------------
-        best_lev_score = 0.0
-        best_lev_epc = None
-
-        for epc in epc_queryset:
-            epc_raw = epc.full_address or ""
-            sale_raw = sale_obj.full_address or ""
+        count, errors, failed = 0, 0, set()
+        with tqdm(desc="Processing sales", unit="record") as progress:
+            for latest_sales in batches:
+                batch_count, batch_errors, batch_failed = self.populate(latest_sales, locations, progress.update)
+                count += batch_count
+                errors += batch_errors
+                failed |= batch_failed
+        return count, errors, failed
+
+    def populate_parallel(self, workers, postcodes, locations, verbosity=1):
+        """Fan postcode districts out to a process pool, biggest first, and report each one's outcome.
+
+        Returns (profiles, errors, postcodes in districts that failed or in profile batches that did not save).
+        """
+        shards = defaultdict(list)
+        for postcode in self.sale_postcodes() if postcodes is None else postcodes:
+            shards[outward_code(postcode)].append(postcode)
+
+        tasks = []
+        for district, postcodes in sorted(shards.items(), key=lambda shard: -len(shard[1])):
+            shard_locations = None
+            if locations is not None:
+                # Keyed like the geocoder's answers, which populate looks sale postcodes up in.
+                keys = {normalize_postcode(postcode) for postcode in postcodes}
+                shard_locations = {key: locations.get(key) for key in keys}
+            tasks.append((populate_shard, district, postcodes, shard_locations, self.audit))
+
+        with tqdm(desc=f"Processing sales ({workers} workers)", unit="record") as bar:
+            results = run_pool(workers, tasks, bar, "districts")
+
+        self.write_summary(sorted(results), verbosity)
+        failed = set()
+        for district, _, _, _, failure, failed_postcodes in results:
+            failed.update(shards[district] if failure else failed_postcodes)
+        return sum(result[1] for result in results), sum(result[2] for result in results), failed
+
+    def write_summary(self, results, verbosity):
+        """Per-district counts at --verbosity 2; districts that failed or had errors are always listed."""
+        lines = []
+        for district, count, errors, elapsed, failure, _ in results:
+            line = f"{district:<8}  {count:>9}  {errors:>7}  {elapsed:>8.1f}"
+            if failure:
+                lines.append(self.style.ERROR(f"{line}  FAILED: {failure}"))
+            elif errors:
+                lines.append(self.style.WARNING(line))
+            elif verbosity > 1:
+                lines.append(line)
+        if lines:
+            self.stdout.write(f"{'district':<8}  {'profiles':>9}  {'errors':>7}  {'seconds':>8}")
+            for line in lines:
+                self.stdout.write(line)
+        failed = sum(1 for result in results if result[4])
+        self.stdout.write(f"{len(results)} districts, {failed} failed")
+
+    def build_profile(self, sale, epc):
+        """The unsaved profile for one sale and its matched EPC (if any); None if there is nothing usable.
+
+        epc is already the latest certificate for its address: candidates come from CurrentEPC.
+        """
+        if not epc:
+            logger.warning("No EPC match for LR @ %s, %s", sale.full_address, sale.postcode)
+            return None
+
+        if not epc.total_floor_area:
+            logger.warning("No usable EPC for %s — missing or no floor area.", sale.full_address)
+            return None
+
+        location = sale.centroid
+        price_per_m2, price_per_ft2 = price_per_area(sale.price_paid, epc.total_floor_area)
+        estimated_beds = estimate_bedrooms(epc)
+
+        return PropertyProfile(
+            postcode=sale.postcode,
+            paon=sale.paon,
+            street=sale.street,
+            land_registry_sale_id=sale.pk,
+            epc_record_id=epc.lm_key,
+            estimated_num_bedrooms=estimated_beds,
+            location=location,
+            price_per_sq_metre=price_per_m2,
+            price_per_sq_ft=price_per_ft2,
+        )
 
-            lev_score = fuzz.ratio(sale_raw.lower(), epc_raw.lower())
 
-            logger.info(
-                "[LevenshteinFallback] Char score=%.2f between raw LR='%s' and EPC='%s'",
-                lev_score,
-                sale_raw,
-                epc_raw,
-            )
 
-            if lev_score > best_lev_score:
-                best_lev_score = lev_score
-                best_lev_epc = epc
+def populate_shard(district, postcodes, locations, audit=None):
+    """Rebuild one postcode district in a worker.
 
-        if best_lev_score >= 90:
-            logger.info(
-                "[LevenshteinFallback] Accepted char match: score=%.2f, LR='%s', EPC='%s'",
-                best_lev_score,
-                sale_obj.full_address,
-                best_lev_epc.full_address,
-            )
-            return best_lev_epc
-
-        logger.error(
-            "No EPC match for sale '%s' — best fuzzy score was %.2f, best Levenshtein %.2f",
-            sale_obj.full_address,
-            best_score,
-            best_lev_score,
+    Returns (district, profiles, errors, seconds, failure, postcodes in profile batches that did not save).
+    """
+    started = time.monotonic()
+    command = Command()
+    command.audit = audit
+    try:
+        count, errors, failed = command.populate(
+            command.latest_sales(postcodes, local=locations is None), locations, report_progress
         )
-
-        return None
-
-
-    def geocode_postcode(self, postcode):
-        try:
-            response = requests.get(f"https://api.postcodes.io/postcodes/{postcode.replace(' ', '')}")
-            if response.status_code == 200:
-                result = response.json()['result']
-                return Point(result['longitude'], result['latitude'])
-        except Exception as e:
-            logger.warning(f"Failed to geocode {postcode}: {e}")
-        return None
-
-    def estimate_bedrooms(self, epc) -> int:
-        hab = epc.number_habitable_rooms
-        typ = epc.property_type
-        area = epc.total_floor_area
-
-        if hab is None:
-            logger.info(f"Missing habitable_rooms for EPC @ {epc.full_address}, pk={epc.pk}")
-            return 1
-
-        baseline = hab - 2
-        if typ and typ.upper() in {"FLAT", "MAISONETTE"}:
-            baseline = hab - 1
-        elif typ.upper() == "TERRACED":
-            baseline = hab - 1.5
-        elif typ.upper() in {"DETACHED", "SEMI-DETACHED"}:
-            baseline = hab - 2
-
-        if area is not None:
-            area = float(area)
-            if area > 200:
-                baseline += 2
-            if area > 140:
-                baseline += 1
-            elif area < 50:
-                baseline -= 1
-
-        return max(min(round(baseline), hab), 1)
-
-    def convert_sq_m_to_sq_ft(self, area_m2):
-        return area_m2 * 10.7639
+    except Exception as e:
+        logger.exception("Populating district %s failed", district)
+        return district, 0, 0, time.monotonic() - started, str(e), set()
+    return district, count, errors, time.monotonic() - started, "", failed
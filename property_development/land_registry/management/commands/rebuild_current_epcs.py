@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from land_registry.ingest import rebuild_current_epcs
+
+
+class Command(BaseCommand):
+    help = "Recreate the current-certificate-per-address table (CurrentEPC) from every imported EPC record"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_current_epcs()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt current certificates for {count} addresses"))
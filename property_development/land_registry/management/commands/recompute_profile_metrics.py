@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from land_registry.metrics import SQ_FT_PER_SQ_M
+from land_registry.models import DatasetVersion, DirtyPostcode, EPCRecord, LandRegistrySale, MapPoint, PropertyProfile
+
+# The metrics build_profile derives, recomputed for every profile in scope in one UPDATE ... FROM the profile's
+# sale and EPC. Rows whose metrics already agree are left alone, so a no-op refresh writes nothing.
+#
+# The bedroom expression mirrors land_registry.metrics.estimate_bedrooms step for step; ties in
+# the baseline (only ever whole or half numbers) round half to even, like Python's round().
+RECOMPUTE_SQL = """
+UPDATE {profile} AS p
+SET price_per_sq_metre = m.per_sq_metre,
+    price_per_sq_ft = m.per_sq_ft,
+    estimated_num_bedrooms = m.bedrooms
+FROM (
+    SELECT id, per_sq_metre, per_sq_ft,
+        CASE WHEN rooms IS NULL THEN 1 ELSE GREATEST(LEAST(
+            CASE WHEN baseline - floor(baseline) = 0.5 THEN 2 * round(baseline / 2) ELSE round(baseline) END,
+            rooms
+        ), 1) END AS bedrooms
+    FROM (
+        SELECT p.id,
+            round(s.price_paid / NULLIF(e.total_floor_area, 0), 2)::double precision AS per_sq_metre,
+            round(s.price_paid / (NULLIF(e.total_floor_area, 0) * %(sq_ft)s), 2)::double precision AS per_sq_ft,
+            e.number_habitable_rooms AS rooms,
+            e.number_habitable_rooms
+                - CASE
+                    WHEN upper(e.property_type) IN ('FLAT', 'MAISONETTE') THEN 1
+                    WHEN upper(e.property_type) = 'TERRACED' THEN 1.5
+                    ELSE 2
+                END
+                + CASE
+                    WHEN e.total_floor_area > 200 THEN 3
+                    WHEN e.total_floor_area > 140 THEN 1
+                    WHEN e.total_floor_area < 50 THEN -1
+                    ELSE 0
+                END AS baseline
+        FROM {profile} AS p
+        JOIN {sale} AS s ON s.unique_id = p.land_registry_sale_id
+        JOIN {epc} AS e ON e.lm_key = p.epc_record_id
+        WHERE {scope}
+    ) AS inputs
+) AS m
+WHERE p.id = m.id
+  AND (p.price_per_sq_metre, p.price_per_sq_ft, p.estimated_num_bedrooms)
+      IS DISTINCT FROM (m.per_sq_metre, m.per_sq_ft, m.bedrooms)
+"""
+
+
+class Command(BaseCommand):
+    help = "Recompute profile price per area and bedroom estimates in SQL from their linked sale and EPC"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dirty",
+            action="store_true",
+            help="Only profiles in postcodes marked dirty by an import (the dirty set is left for a rebuild).",
+        )
+        parser.add_argument(
+            "--postcode-prefix",
+            action="append",
+            default=[],
+            help="Only profiles whose postcode starts with this, e.g. LL30; repeat for several.",
+        )
+
+    def handle(self, *args, **options):
+        scope, params = ["TRUE"], {"sq_ft": SQ_FT_PER_SQ_M}
+        if options["dirty"]:
+            scope.append(f"p.postcode IN (SELECT postcode FROM {quote(DirtyPostcode)})")
+        if options["postcode_prefix"]:
+            scope.append("p.postcode LIKE ANY(%(prefixes)s)")
+            params["prefixes"] = [f"{prefix.upper()}%" for prefix in options["postcode_prefix"]]
+
+        sql = RECOMPUTE_SQL.format(
+            profile=quote(PropertyProfile),
+            sale=quote(LandRegistrySale),
+            epc=quote(EPCRecord),
+            scope=" AND ".join(scope),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated = cursor.rowcount
+        if updated:
+            MapPoint.refresh()
+            DatasetVersion.bump(DatasetVersion.PROPERTY_PROFILES)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated metrics on {updated} profiles"))
+
+
+def quote(model):
+    return connection.ops.quote_name(model._meta.db_table)
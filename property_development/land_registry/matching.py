@@ -0,0 +1,328 @@
+"""Matching Land Registry sales to EPC certificates.
+
+EPC candidates are loaded once per postcode as lightweight named tuples (see load_epc_candidates)
+and every sale in that postcode is resolved against the same list. They come from CurrentEPC, so
+each address is represented by its latest certificate only. Both sides carry the output of
+normalize_address in their address_clean / address_tokens / address_numbers columns, written at
+import time, so matching never re-runs the cleaning regexes.
+"""
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .models import CurrentEPC
+from .postcodes import normalize_postcode
+
+logger = logging.getLogger("land_registry")
+
+COMMON_NOISE_WORDS = [
+    r"\bflat\b", r"\bapartment\b", r"\bapt\b", r"\bunit\b", r"\bthe\b", r"\bhouse\b",
+    r"\bproperty\b", r"\bfarm\b", r"\bbungalow\b", r"\bvilla\b", r"\bold\b"
+]
+
+ADDRESS_CLEANER = re.compile("|".join(COMMON_NOISE_WORDS), re.IGNORECASE)
+SEPARATORS = re.compile(r"[-/]")
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+# Scores a match must reach, and the most the fuzzy boosts can add on top of token_sort_ratio.
+FUZZY_ACCEPT = 70
+LEVENSHTEIN_ACCEPT = 90
+MAX_BOOST = 15 + 10 + 20
+# Base scores under this can't reach FUZZY_ACCEPT even with every boost, so cdist may zero them.
+FUZZY_CUTOFF = FUZZY_ACCEPT - MAX_BOOST
+
+# Matrices smaller than this are scored on one thread.
+PARALLEL_MIN_PAIRS = 20_000
+
+# The EPC columns matching and profile building need (all of them on CurrentEPC); lm_key first.
+EPC_CANDIDATE_FIELDS = (
+    "lm_key", "full_address", "postcode", "property_type", "inspection_date", "total_floor_area",
+    "number_habitable_rooms", "address_clean", "address_tokens", "address_numbers",
+)
+
+
+def load_epc_candidates(postcode):
+    """The current certificate of every EPC address in postcode, as named tuples of EPC_CANDIDATE_FIELDS."""
+    return list(
+        CurrentEPC.objects.filter(postcode=postcode)
+        .order_by("lm_key")
+        .values_list(*EPC_CANDIDATE_FIELDS, named=True)
+    )
+
+
+def latest_certificate(candidates, full_address):
+    """The most recently inspected candidate for full_address (undated certificates rank last).
+
+    CurrentEPC already holds one certificate per address; this is for candidate lists that don't.
+    """
+    same_address = [epc for epc in candidates if epc.full_address == full_address]
+    if not same_address:
+        return None
+    return max(same_address, key=lambda epc: (epc.inspection_date is not None, epc.inspection_date or 0))
+
+
+def build_full_address(saon, paon, street):
+    """A sale's full_address: its saon, paon and street, stripped and comma-joined, blanks left out."""
+    return ", ".join(filter(None, [
+        (saon or "").strip(),
+        (paon or "").strip(),
+        (street or "").strip(),
+    ]))
+
+
+def clean_address(text):
+    if not text:
+        return ""
+    text = SEPARATORS.sub(" ", text)
+    text = ADDRESS_CLEANER.sub("", text)
+    text = PUNCTUATION.sub("", text).lower()
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def extract_numbers(text):
+    return re.findall(r"\b\d+\b", text)
+
+
+def normalize_address(text):
+    """(clean text, distinct tokens, house numbers) for the address_* columns."""
+    clean = clean_address(text)
+    return clean, list(dict.fromkeys(clean.split())), extract_numbers(clean)
+
+
+def sale_match_key(postcode, address_clean):
+    """The exact-match key for a sale: normalized postcode plus its address_clean.
+
+    address_clean already is the cleaned saon, paon and street (full_address joins them; cleaning drops
+    the commas), so the key reuses it rather than cleaning them again.
+    """
+    if not address_clean:
+        return ""
+    return f"{normalize_postcode(postcode)}|{address_clean}"
+
+
+def epc_match_key(postcode, address1, address2):
+    """The exact-match key for an EPC, built to line up with sale_match_key.
+
+    ADDRESS1 holds the number and street ("12 High Street"), or a flat or house name with the
+    street in ADDRESS2 ("Flat 4" / "115 Pen Y Bryn", "Rose Cottage" / "Mill Lane"). ADDRESS2 is
+    otherwise usually the locality, which Land Registry keeps out of saon/paon/street.
+    """
+    lines = [address1]
+    if address2 and (not re.search(r"\d", address1 or "") or address2.lstrip()[:1].isdigit()):
+        lines.append(address2)
+    return _match_key(postcode, lines)
+
+
+def _match_key(postcode, parts):
+    clean = clean_address(" ".join(part for part in parts if part))
+    if not clean:
+        return ""
+    return f"{normalize_postcode(postcode)}|{clean}"
+
+
+@dataclass(frozen=True, slots=True)
+class MatchResult:
+    """How one sale was resolved, for the match audit (see populate_property_profiles --match-audit)."""
+
+    sale_id: str
+    postcode: str
+    sale_address: str
+    tier: str  # "exact", "fast", "fuzzy", "levenshtein" or "none"
+    epc_id: str | None = None
+    epc_address: str | None = None
+    score: float | None = None  # the deciding tier's score; for "none", the best fuzzy score
+    boosts: tuple[str, ...] = ()
+    candidates: int = 0
+
+
+def best_match(candidates, sale_obj):
+    return match_postcode([sale_obj], candidates)[0]
+
+
+def match_postcode(sales, candidates, workers=-1, audit=None, timings=None):
+    """Resolve every sale in a postcode against its EPC candidates; one EPC (or None) per sale.
+
+    Sales carrying an exact_epc (the lm_key of the latest EPC sharing their match_key, joined in by
+    SQL) take that EPC. The rest go through the fuzzy tiers, which score the whole sales x candidates
+    matrix with rapidfuzz.process.cdist and apply the boosts as array operations.
+    Pass a list as audit to have a MatchResult appended for every sale, and a dict as timings to have
+    the seconds spent in each tier added to it.
+    """
+    started = time.perf_counter() if timings is not None else None
+    by_key = {epc.lm_key: epc for epc in candidates}
+    results = [by_key.get(getattr(sale, "exact_epc", None)) for sale in sales]
+    remaining = [i for i, epc in enumerate(results) if epc is None]
+
+    if audit is not None:
+        for sale, epc in zip(sales, results, strict=True):
+            if epc is not None:
+                audit.append(MatchResult(
+                    sale.pk, sale.postcode, sale.full_address, "exact", epc.lm_key, epc.full_address,
+                    candidates=len(candidates),
+                ))
+
+    if timings is not None:
+        _lap(timings, "exact", started)
+    if remaining:
+        fuzzy = _match_fuzzy([sales[i] for i in remaining], candidates, workers, audit, timings)
+        for i, epc in zip(remaining, fuzzy, strict=True):
+            results[i] = epc
+    return results
+
+
+def _match_fuzzy(sales, candidates, workers, audit, timings):
+    started = time.perf_counter() if timings is not None else None
+    if not sales:
+        return []
+    if not candidates:
+        for sale in sales:
+            logger.error("No EPC match for sale '%s' — no EPC certificates in %s", sale.full_address, sale.postcode)
+            if audit is not None:
+                audit.append(MatchResult(sale.pk, sale.postcode, sale.full_address, "none"))
+        return [None] * len(sales)
+
+    n_sales, n_epcs = len(sales), len(candidates)
+    # Spinning up threads costs more than it saves on small postcodes.
+    workers = workers if n_sales * n_epcs >= PARALLEL_MIN_PAIRS else 1
+
+    # ---- Single-number sales may only match EPCs carrying that number -------
+    epc_numbers = _incidence([epc.address_numbers for epc in candidates])
+    single_number = np.array([len(sale.address_numbers) == 1 for sale in sales])
+    has_number = np.zeros((n_sales, n_epcs), dtype=bool)
+    for i, sale in enumerate(sales):
+        if single_number[i]:
+            has_number[i] = epc_numbers.column(sale.address_numbers[0])
+    allowed = np.where(single_number[:, None], has_number, True)
+
+    # ---- Fast path: single number + same postcode ---------------------------
+    sale_postcodes = np.array([sale.postcode.replace(" ", "").upper() for sale in sales])
+    epc_postcodes = np.array([epc.postcode.replace(" ", "").upper() for epc in candidates])
+    fast = has_number & (sale_postcodes[:, None] == epc_postcodes[None, :])
+
+    # ---- Fallback: fuzzy + hybrid boosts -----------------------------------
+    sale_clean = [sale.address_clean for sale in sales]
+    epc_clean = [epc.address_clean for epc in candidates]
+    base = process.cdist(
+        sale_clean, epc_clean, scorer=fuzz.token_sort_ratio, dtype=np.float64,
+        score_cutoff=FUZZY_CUTOFF, workers=workers,
+    )
+
+    tokens = _incidence([epc.address_tokens for epc in candidates])
+    sale_tokens = tokens.rows([sale.address_tokens for sale in sales])
+    shared = sale_tokens.astype(np.int32) @ tokens.matrix.T.astype(np.int32)
+    sale_token_counts = np.array([len(set(sale.address_tokens)) for sale in sales])
+    # A sale token missing from every candidate can never be in an EPC's token set.
+    complete = np.array([all(t in tokens.vocab for t in sale.address_tokens) for sale in sales])
+    subset = (shared == sale_token_counts[:, None]) & (sale_token_counts > 0)[:, None] & complete[:, None]
+    overlap = shared > 0
+
+    # Substring boost only where the base score is halfway plausible. (An EPC that starts with the
+    # sale text also contains it, so the old prefix boost never applied on its own.)
+    substring = np.zeros((n_sales, n_epcs), dtype=bool)
+    for i, j in zip(*np.nonzero(base > 40), strict=True):
+        substring[i, j] = sale_clean[i] in epc_clean[j]
+
+    score = base + 15 * subset + 10 * overlap + 20 * substring
+    score = np.where(allowed, np.minimum(score, 100.0), 0.0)
+
+    results = [None] * n_sales
+    # (tier, candidate index, score) per sale, for the audit.
+    decisions = [None] * n_sales
+    unresolved = []
+    for i, sale in enumerate(sales):
+        if fast[i].any():
+            j = int(fast[i].argmax())
+            epc = candidates[j]
+            logger.info("[FastMatch] Number+postcode: LR='%s' ↔ EPC='%s'", sale.full_address, epc.full_address)
+            results[i] = epc
+            decisions[i] = ("fast", j, None)
+            continue
+        j = int(score[i].argmax())
+        if score[i, j] >= FUZZY_ACCEPT:
+            results[i] = candidates[j]
+            decisions[i] = ("fuzzy", j, score[i, j])
+        else:
+            unresolved.append(i)
+            decisions[i] = ("none", None, score[i, j])
+
+    if timings is not None:
+        started = _lap(timings, "fuzzy", started)
+
+    # ---- Final fallback: Levenshtein ---------------------------------------
+    if unresolved:
+        lev = process.cdist(
+            [(sales[i].full_address or "").lower() for i in unresolved],
+            [(epc.full_address or "").lower() for epc in candidates],
+            scorer=fuzz.ratio, dtype=np.float64, score_cutoff=LEVENSHTEIN_ACCEPT, workers=workers,
+        )
+        for row, i in enumerate(unresolved):
+            j = int(lev[row].argmax())
+            if lev[row, j] >= LEVENSHTEIN_ACCEPT:
+                logger.info(
+                    "[LevenshteinFallback] Accepted char match: score=%.2f, LR='%s', EPC='%s'",
+                    lev[row, j], sales[i].full_address, candidates[j].full_address,
+                )
+                results[i] = candidates[j]
+                decisions[i] = ("levenshtein", j, lev[row, j])
+            else:
+                logger.error(
+                    "No EPC match for sale '%s' — best fuzzy score was %.2f, best Levenshtein below %.2f",
+                    sales[i].full_address, score[i].max(), LEVENSHTEIN_ACCEPT,
+                )
+        if timings is not None:
+            _lap(timings, "levenshtein", started)
+
+    if audit is not None:
+        boost_names = (("token_subset", subset), ("token_overlap", overlap), ("substring", substring))
+        for i, (sale, (tier, j, tier_score)) in enumerate(zip(sales, decisions, strict=True)):
+            epc = candidates[j] if j is not None else None
+            audit.append(MatchResult(
+                sale.pk,
+                sale.postcode,
+                sale.full_address,
+                tier,
+                epc.lm_key if epc else None,
+                epc.full_address if epc else None,
+                None if tier_score is None else round(float(tier_score), 2),
+                tuple(name for name, hits in boost_names if hits[i, j]) if tier == "fuzzy" else (),
+                n_epcs,
+            ))
+
+    return results
+
+
+def _lap(timings, tier, started):
+    """Add the seconds since started to timings[tier] and return the current time."""
+    now = time.perf_counter()
+    timings[tier] = timings.get(tier, 0.0) + now - started
+    return now
+
+
+class _incidence:
+    """Boolean candidates x vocabulary matrix for the terms each candidate carries."""
+
+    def __init__(self, term_lists):
+        self.vocab = {}
+        for terms in term_lists:
+            for term in terms:
+                self.vocab.setdefault(term, len(self.vocab))
+        self.matrix = np.zeros((len(term_lists), len(self.vocab)), dtype=bool)
+        for row, terms in enumerate(term_lists):
+            self.matrix[row, [self.vocab[term] for term in terms]] = True
+
+    def column(self, term):
+        if term not in self.vocab:
+            return np.zeros(self.matrix.shape[0], dtype=bool)
+        return self.matrix[:, self.vocab[term]]
+
+    def rows(self, term_lists):
+        """The same vocabulary applied to other term lists; unknown terms are dropped."""
+        out = np.zeros((len(term_lists), len(self.vocab)), dtype=bool)
+        for row, terms in enumerate(term_lists):
+            out[row, [self.vocab[term] for term in terms if term in self.vocab]] = True
+        return out
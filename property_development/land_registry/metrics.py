@@ -0,0 +1,51 @@
+"""Profile metrics derived from a sale and its EPC.
+
+populate_property_profiles computes them per profile; recompute_profile_metrics repeats the same
+arithmetic in SQL, and benchmark_matching checks the bedroom estimate against labelled certificates.
+"""
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+
+logger = logging.getLogger("land_registry")
+
+# Kept in Decimal so profiles round exactly as recompute_profile_metrics' numeric SQL does.
+SQ_FT_PER_SQ_M = Decimal("10.7639")
+CENT = Decimal("0.01")
+
+
+def price_per_area(price_paid, floor_area_m2):
+    """(£ per m², £ per ft²) to the penny, rounding halves up."""
+    price = Decimal(price_paid)
+    floor_area = Decimal(floor_area_m2)
+    per_sq_metre = (price / floor_area).quantize(CENT, ROUND_HALF_UP)
+    per_sq_ft = (price / (floor_area * SQ_FT_PER_SQ_M)).quantize(CENT, ROUND_HALF_UP)
+    return float(per_sq_metre), float(per_sq_ft)
+
+
+def estimate_bedrooms(epc) -> int:
+    hab = epc.number_habitable_rooms
+    typ = epc.property_type
+    area = epc.total_floor_area
+
+    if hab is None:
+        logger.info("Missing habitable_rooms for EPC @ %s, lm_key=%s", epc.full_address, epc.lm_key)
+        return 1
+
+    baseline = hab - 2
+    if typ and typ.upper() in {"FLAT", "MAISONETTE"}:
+        baseline = hab - 1
+    elif typ.upper() == "TERRACED":
+        baseline = hab - 1.5
+    elif typ.upper() in {"DETACHED", "SEMI-DETACHED"}:
+        baseline = hab - 2
+
+    if area is not None:
+        area = float(area)
+        if area > 200:
+            baseline += 2
+        if area > 140:
+            baseline += 1
+        elif area < 50:
+            baseline -= 1
+
+    return max(min(round(baseline), hab), 1)
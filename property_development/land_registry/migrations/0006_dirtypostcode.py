@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0005_remove_landregistrysale_num_bedrooms_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyPostcode',
+            fields=[
+                ('postcode', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('marked_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
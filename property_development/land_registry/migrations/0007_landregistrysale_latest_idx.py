@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0006_dirtypostcode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='landregistrysale',
+            index=models.Index(fields=['postcode', 'paon', 'street', '-deed_date'], name='lr_sale_latest_idx'),
+        ),
+    ]
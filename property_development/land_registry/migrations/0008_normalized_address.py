@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:53
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0007_landregistrysale_latest_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='epcrecord',
+            name='address_clean',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='epcrecord',
+            name='address_numbers',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='epcrecord',
+            name='address_tokens',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='landregistrysale',
+            name='address_clean',
+            field=models.CharField(blank=True, default='', max_length=256),
+        ),
+        migrations.AddField(
+            model_name='landregistrysale',
+            name='address_numbers',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='landregistrysale',
+            name='address_tokens',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='epcrecord',
+            index=models.Index(fields=['postcode', 'address_clean'], name='epc_address_clean_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='landregistrysale',
+            index=models.Index(fields=['postcode', 'address_clean'], name='lr_sale_address_clean_idx'),
+        ),
+    ]
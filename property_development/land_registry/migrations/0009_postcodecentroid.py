@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:07
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0008_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostcodeCentroid',
+            fields=[
+                ('postcode', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('location', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+            ],
+        ),
+    ]
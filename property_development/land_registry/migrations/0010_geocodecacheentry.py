@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:08
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0009_postcodecentroid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('postcode', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('location', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0010_geocodecacheentry'),
+    ]
+
+    operations = [
+        # Existing duplicates would block the constraint; keep the most recently created profile per key.
+        migrations.RunSQL(
+            """
+            DELETE FROM land_registry_propertyprofile older
+            USING land_registry_propertyprofile newer
+            WHERE older.postcode = newer.postcode
+              AND older.paon = newer.paon
+              AND older.street = newer.street
+              AND older.id < newer.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='propertyprofile',
+            constraint=models.UniqueConstraint(fields=('postcode', 'paon', 'street'), name='property_profile_address_key'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0011_propertyprofile_address_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='epcrecord',
+            name='match_key',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='landregistrysale',
+            name='match_key',
+            field=models.CharField(blank=True, default='', max_length=300),
+        ),
+        migrations.AddIndex(
+            model_name='epcrecord',
+            index=models.Index(fields=['match_key'], name='epc_match_key_idx'),
+        ),
+    ]
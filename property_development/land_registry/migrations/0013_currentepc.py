@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:39
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0012_match_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentEPC',
+            fields=[
+                ('lm_key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('postcode', models.CharField(max_length=10)),
+                ('full_address', models.TextField(blank=True)),
+                ('property_type', models.CharField(blank=True, max_length=50)),
+                ('inspection_date', models.DateField(blank=True, null=True)),
+                ('total_floor_area', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('number_habitable_rooms', models.IntegerField(blank=True, null=True)),
+                ('address_clean', models.TextField(blank=True, default='')),
+                ('address_tokens', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None)),
+                ('address_numbers', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None)),
+                ('match_key', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['match_key'], name='current_epc_match_key_idx')],
+                'constraints': [models.UniqueConstraint(fields=('postcode', 'full_address'), name='current_epc_address')],
+            },
+        ),
+        # Seed it from the certificates already imported; import_epc_data maintains it from here on.
+        migrations.RunSQL(
+            """
+            INSERT INTO land_registry_currentepc (
+                lm_key, postcode, full_address, property_type, inspection_date, total_floor_area,
+                number_habitable_rooms, address_clean, address_tokens, address_numbers, match_key
+            )
+            SELECT DISTINCT ON (postcode, full_address)
+                lm_key, postcode, full_address, property_type, inspection_date, total_floor_area,
+                number_habitable_rooms, address_clean, address_tokens, address_numbers, match_key
+            FROM land_registry_epcrecord
+            ORDER BY postcode, full_address, inspection_date DESC NULLS LAST, lm_key
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
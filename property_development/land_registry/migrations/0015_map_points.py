@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:48
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0014_datasetversion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE MATERIALIZED VIEW land_registry_map_points AS
+            SELECT
+                p.id,
+                p.location,
+                p.postcode,
+                COALESCE(NULLIF(s.full_address, ''), concat_ws(' ', NULLIF(p.paon, ''), NULLIF(p.street, ''))) AS address,
+                s.price_paid,
+                s.deed_date,
+                p.price_per_sq_ft,
+                p.price_per_sq_metre,
+                p.estimated_num_bedrooms AS bedrooms,
+                e.total_floor_area AS floor_area,
+                e.number_habitable_rooms AS habitable_rooms
+            FROM land_registry_propertyprofile p
+            LEFT JOIN land_registry_landregistrysale s ON s.unique_id = p.land_registry_sale_id
+            LEFT JOIN land_registry_epcrecord e ON e.lm_key = p.epc_record_id
+            WHERE p.location IS NOT NULL;
+
+            -- REFRESH ... CONCURRENTLY needs a unique index.
+            CREATE UNIQUE INDEX map_points_id_idx ON land_registry_map_points (id);
+            CREATE INDEX map_points_location_idx ON land_registry_map_points USING gist (location);
+            CREATE INDEX map_points_price_paid_idx ON land_registry_map_points (price_paid);
+            CREATE INDEX map_points_deed_date_idx ON land_registry_map_points (deed_date);
+            CREATE INDEX map_points_price_per_sq_ft_idx ON land_registry_map_points (price_per_sq_ft);
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW land_registry_map_points",
+        ),
+        migrations.CreateModel(
+            name='MapPoint',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('location', django.contrib.gis.db.models.fields.PointField(geography=True, srid=4326)),
+                ('postcode', models.CharField(max_length=10)),
+                ('address', models.TextField()),
+                ('price_paid', models.IntegerField(null=True)),
+                ('deed_date', models.DateField(null=True)),
+                ('price_per_sq_ft', models.FloatField(null=True)),
+                ('price_per_sq_metre', models.FloatField(null=True)),
+                ('bedrooms', models.PositiveSmallIntegerField(null=True)),
+                ('floor_area', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('habitable_rooms', models.IntegerField(null=True)),
+            ],
+            options={
+                'db_table': 'land_registry_map_points',
+                'managed': False,
+            },
+        ),
+    ]
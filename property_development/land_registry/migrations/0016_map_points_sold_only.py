@@ -0,0 +1,45 @@
+from django.db import migrations
+
+DROP_MAP_POINTS_SQL = "DROP MATERIALIZED VIEW land_registry_map_points;"
+
+MAP_POINTS_SQL = """
+CREATE MATERIALIZED VIEW land_registry_map_points AS
+SELECT
+    p.id,
+    p.location,
+    p.postcode,
+    COALESCE(NULLIF(s.full_address, ''), concat_ws(' ', NULLIF(p.paon, ''), NULLIF(p.street, ''))) AS address,
+    s.price_paid,
+    s.deed_date,
+    p.price_per_sq_ft,
+    p.price_per_sq_metre,
+    p.estimated_num_bedrooms AS bedrooms,
+    e.total_floor_area AS floor_area,
+    e.number_habitable_rooms AS habitable_rooms
+FROM land_registry_propertyprofile p
+{sale_join} land_registry_landregistrysale s ON s.unique_id = p.land_registry_sale_id
+LEFT JOIN land_registry_epcrecord e ON e.lm_key = p.epc_record_id
+WHERE p.location IS NOT NULL;
+
+-- REFRESH ... CONCURRENTLY needs a unique index.
+CREATE UNIQUE INDEX map_points_id_idx ON land_registry_map_points (id);
+CREATE INDEX map_points_location_idx ON land_registry_map_points USING gist (location);
+CREATE INDEX map_points_price_paid_idx ON land_registry_map_points (price_paid);
+CREATE INDEX map_points_deed_date_idx ON land_registry_map_points (deed_date);
+CREATE INDEX map_points_price_per_sq_ft_idx ON land_registry_map_points (price_per_sq_ft);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0015_map_points'),
+    ]
+
+    operations = [
+        # Only map profiles that still have a sale: without one there is no price or date to show.
+        migrations.RunSQL(
+            DROP_MAP_POINTS_SQL + MAP_POINTS_SQL.format(sale_join="JOIN"),
+            reverse_sql=DROP_MAP_POINTS_SQL + MAP_POINTS_SQL.format(sale_join="LEFT JOIN"),
+        ),
+    ]
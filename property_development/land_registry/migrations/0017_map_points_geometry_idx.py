@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0016_map_points_sold_only'),
+    ]
+
+    operations = [
+        # Vector tiles select points on a lat/lng box (location::geometry &&), which the geography index can't serve.
+        migrations.RunSQL(
+            "CREATE INDEX map_points_geometry_idx ON land_registry_map_points USING gist ((location::geometry));",
+            reverse_sql="DROP INDEX map_points_geometry_idx;",
+        ),
+    ]
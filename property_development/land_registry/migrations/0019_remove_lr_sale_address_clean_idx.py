@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('land_registry', '0018_remove_epc_match_key_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='landregistrysale',
+            name='lr_sale_address_clean_idx',
+        ),
+    ]
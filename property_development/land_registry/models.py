@@ -1,5 +1,7 @@
 from django.contrib.gis.db import models as gis_models
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models
+from django.utils import timezone
 
 
 class LandRegistrySale(models.Model):
@@ -23,6 +25,19 @@ class LandRegistrySale(models.Model):
     district = models.CharField(max_length=100, blank=True)
     county = models.CharField(max_length=100, blank=True)
 
+    # Normalized address used by matching (land_registry.matching.normalize_address), set at import time
+    address_clean = models.CharField(max_length=256, blank=True, default="")
+    address_tokens = ArrayField(models.TextField(), blank=True, default=list)
+    address_numbers = ArrayField(models.TextField(), blank=True, default=list)
+    # Exact-match key shared with EPCRecord (land_registry.matching.sale_match_key)
+    match_key = models.CharField(max_length=300, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # Serves the newer-sale anti-join that picks each address's latest sale in populate_property_profiles.
+            models.Index(fields=["postcode", "paon", "street", "-deed_date"], name="lr_sale_latest_idx"),
+        ]
+
     def __str__(self):
         return f"{self.postcode} - £{self.price_paid} ({self.deed_date})"
 
@@ -42,6 +57,50 @@ class EPCRecord(models.Model):
     uprn = models.CharField(max_length=100, blank=True, db_index=True)
     full_address = models.TextField(blank=True)
 
+    # Normalized address used by matching (land_registry.matching.normalize_address), set at import time
+    address_clean = models.TextField(blank=True, default="")
+    address_tokens = ArrayField(models.TextField(), blank=True, default=list)
+    address_numbers = ArrayField(models.TextField(), blank=True, default=list)
+    # Exact-match key shared with LandRegistrySale (land_registry.matching.epc_match_key)
+    match_key = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # Leading postcode serves refresh_current_epcs' lookup of other certificates for the same address.
+            models.Index(fields=["postcode", "address_clean"], name="epc_address_clean_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.full_address} ({self.postcode})"
+
+
+class CurrentEPC(models.Model):
+    """The latest certificate for each address (postcode + full_address), and only the columns matching reads.
+
+    import_epc_data keeps it in step with EPCRecord batch by batch (land_registry.ingest.refresh_current_epcs);
+    rebuild_current_epcs recreates it from scratch.
+    """
+
+    lm_key = models.CharField(max_length=100, primary_key=True)  # EPCRecord.lm_key
+    postcode = models.CharField(max_length=10)
+    full_address = models.TextField(blank=True)
+    property_type = models.CharField(max_length=50, blank=True)
+    inspection_date = models.DateField(null=True, blank=True)
+    total_floor_area = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    number_habitable_rooms = models.IntegerField(null=True, blank=True)
+    address_clean = models.TextField(blank=True, default="")
+    address_tokens = ArrayField(models.TextField(), blank=True, default=list)
+    address_numbers = ArrayField(models.TextField(), blank=True, default=list)
+    match_key = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            # One certificate per address; leading postcode also serves the per-postcode candidate load.
+            models.UniqueConstraint(fields=["postcode", "full_address"], name="current_epc_address"),
+        ]
+        indexes = [
+            models.Index(fields=["match_key"], name="current_epc_match_key_idx"),
+        ]
 
     def __str__(self):
         return f"{self.full_address} ({self.postcode})"
@@ -73,5 +132,97 @@ class PropertyProfile(models.Model):
     # For mapping
     location = gis_models.PointField(geography=True, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # One profile per address key; populate_property_profiles upserts on it.
+            models.UniqueConstraint(fields=["postcode", "paon", "street"], name="property_profile_address_key"),
+        ]
+
     def __str__(self):
         return f"{self.paon} {self.street} ({self.postcode})"
+
+
+class DirtyPostcode(models.Model):
+    """A postcode whose sales changed since its profiles were last rebuilt."""
+
+    postcode = models.CharField(max_length=10, primary_key=True)
+    marked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.postcode
+
+
+class PostcodeCentroid(models.Model):
+    """Where a postcode is, from the ONS Postcode Directory or Code-Point Open (import_postcode_centroids)."""
+
+    postcode = models.CharField(max_length=8, primary_key=True)  # normalize_postcode() form, e.g. 'LL30 2DG'
+    location = gis_models.PointField(srid=4326)
+
+    def __str__(self):
+        return self.postcode
+
+
+class GeocodeCacheEntry(models.Model):
+    """A postcode lookup from the HTTP geocoder; location is null when the service didn't know the postcode."""
+
+    postcode = models.CharField(max_length=8, primary_key=True)
+    location = gis_models.PointField(srid=4326, null=True, blank=True)
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.postcode
+
+
+class DatasetVersion(models.Model):
+    """A counter bumped whenever a derived dataset is rebuilt, so caches of it can key on the version."""
+
+    PROPERTY_PROFILES = "property_profiles"
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        cls.objects.get_or_create(name=name)
+        cls.objects.filter(name=name).update(version=models.F("version") + 1, updated_at=timezone.now())
+
+
+class MapPoint(models.Model):
+    """A located PropertyProfile with what the map filters on and shows, denormalized from its sale and EPC.
+
+    Backed by the land_registry_map_points materialized view (migrations 0015 and 0016), so the map never joins per
+    request; populate_property_profiles and the commands that edit profiles call refresh() when they finish.
+    """
+
+    id = models.BigIntegerField(primary_key=True)  # PropertyProfile.id
+    location = gis_models.PointField(geography=True)
+    postcode = models.CharField(max_length=10)
+    address = models.TextField()
+    price_paid = models.IntegerField(null=True)
+    deed_date = models.DateField(null=True)
+    price_per_sq_ft = models.FloatField(null=True)
+    price_per_sq_metre = models.FloatField(null=True)
+    bedrooms = models.PositiveSmallIntegerField(null=True)
+    floor_area = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # m², from the EPC
+    habitable_rooms = models.IntegerField(null=True)
+
+    class Meta:
+        managed = False
+        db_table = "land_registry_map_points"
+
+    def __str__(self):
+        return f"{self.address} ({self.postcode})"
+
+    @classmethod
+    def refresh(cls):
+        # CONCURRENTLY keeps the map readable during the refresh; it needs the unique index on id.
+        with connection.cursor() as cursor:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {connection.ops.quote_name(cls._meta.db_table)}")
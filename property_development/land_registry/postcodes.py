@@ -0,0 +1,23 @@
+"""UK postcode formatting shared by the importers, geocoding and profile building."""
+import re
+
+# Outward code (area + district) followed by the three-character inward code.
+POSTCODE_PATTERN = re.compile(r"^([A-Z]{1,2}[0-9][A-Z0-9]?)([0-9][A-Z]{2})$")
+
+
+def normalize_postcode(postcode):
+    """The canonical 'OUT IN' form used by Land Registry and EPC data, e.g. 'll30 2dg' -> 'LL30 2DG'.
+
+    Postcodes that don't parse (partial or overseas codes) come back upper-cased with their spaces
+    collapsed, so they still compare equal to themselves.
+    """
+    compact = re.sub(r"\s+", "", postcode or "").upper()
+    match = POSTCODE_PATTERN.match(compact)
+    if not match:
+        return compact
+    return f"{match.group(1)} {match.group(2)}"
+
+
+def outward_code(postcode):
+    """'LL30 2DG' -> 'LL30'."""
+    return normalize_postcode(postcode).split(" ")[0]
@@ -1,2 +1,367 @@
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+
+from land_registry import geocoding
+from land_registry.geocoding import BULK_LIMIT, HTTPGeocoder
+from land_registry.ingest import CSVStream, Source
+from land_registry.management.commands import import_lr_data, populate_property_profiles
+from land_registry.management.commands.benchmark_matching import (
+    DEFAULT_CORPUS,
+    load_corpus,
+    match_corpus,
+    precision_recall,
+    score,
+)
+from land_registry.management.commands.fake_geocoder import FakeGeocoderHandler
+from land_registry.management.commands.import_epc_data import EPC_CSV_COLUMNS, import_stream
+from land_registry.matching import match_postcode, normalize_address
+from land_registry.models import CurrentEPC, PropertyProfile
+
+
+class CSVStreamTests(SimpleTestCase):
+    def write_csv(self, lines):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        with handle:
+            handle.write("".join(lines))
+        self.addCleanup(os.unlink, handle.name)
+        return Source(handle.name)
+
+    def read_from(self, source, start_offset, fieldnames=None):
+        with CSVStream(source, fieldnames=fieldnames, start_offset=start_offset, on_progress=lambda n: None) as stream:
+            return [row[0] for row in stream.rows()]
+
+    def checkpoint_after(self, source, count, fieldnames=None):
+        """The offset a checkpoint saves once count rows have been imported."""
+        with CSVStream(source, fieldnames=fieldnames, on_progress=lambda n: None) as stream:
+            rows = stream.rows()
+            for _ in range(count):
+                next(rows)
+            return stream.offset
+
+    def test_headerless_resume_skips_imported_rows(self):
+        source = self.write_csv([f"{{ID{n}}},A\n" for n in range(5)])
+        fieldnames = ["unique_id", "record_status"]
+        offset = self.checkpoint_after(source, 2, fieldnames)
+
+        self.assertEqual(self.read_from(source, offset, fieldnames), ["{ID2}", "{ID3}", "{ID4}"])
+
+    def test_headerless_resume_right_after_first_row(self):
+        source = self.write_csv([f"{{ID{n}}},A\n" for n in range(3)])
+        fieldnames = ["unique_id", "record_status"]
+        offset = self.checkpoint_after(source, 1, fieldnames)
+
+        self.assertEqual(self.read_from(source, offset, fieldnames), ["{ID1}", "{ID2}"])
+
+    def test_headerless_without_resume_keeps_first_row(self):
+        source = self.write_csv([f"{{ID{n}}},A\n" for n in range(3)])
+
+        self.assertEqual(self.read_from(source, 0, ["unique_id", "record_status"]), ["{ID0}", "{ID1}", "{ID2}"])
+
+    def test_blank_lines_are_skipped(self):
+        source = self.write_csv(["\n", "unique_id,record_status\n", "{ID0},A\n", "\n", "{ID1},A\n", "\n"])
+
+        self.assertEqual(self.read_from(source, 0), ["{ID0}", "{ID1}"])
+
+    def test_resume_with_header(self):
+        source = self.write_csv(["unique_id,record_status\n"] + [f"{{ID{n}}},A\n" for n in range(4)])
+        offset = self.checkpoint_after(source, 1)
+
+        self.assertEqual(self.read_from(source, offset), ["{ID1}", "{ID2}", "{ID3}"])
+
+
+class MatchCorpusTests(SimpleTestCase):
+    """The labelled corpus benchmark_matching scores, held to the README's thresholds."""
+
+    def setUp(self):
+        # Matching logs every sale it can't place; the corpus has some on purpose.
+        logger = logging.getLogger("land_registry")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+    def test_precision_and_recall(self):
+        groups = load_corpus(DEFAULT_CORPUS)
+        predicted = match_corpus(groups)
+        outcome, errors = score(groups, predicted)
+        precision, recall = precision_recall(outcome)
+
+        self.assertGreaterEqual(precision, 0.9, errors["matches"])
+        self.assertGreaterEqual(recall, 0.95, errors["matches"])
+
+
+def csv_source(test, header, rows):
+    """A temporary CSV source with header and rows, removed when test finishes."""
+    handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="")
+    with handle:
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        writer.writerows(rows)
+    test.addCleanup(os.unlink, handle.name)
+    return Source(handle.name)
+
+
+class MatchCorpusQuerysetTests(TestCase):
+    """The labelled corpus imported as LandRegistrySale and EPCRecord rows, then matched by populate.
+
+    Unlike MatchCorpusTests, the exact tier, candidate loading and CurrentEPC come from the real SQL: the sales
+    go through import_lr_data's bulk COPY, the EPCs through import_epc_data's batches (and CurrentEPC refresh),
+    and populate_property_profiles reads them back with latest_sales and load_epc_candidates.
+    """
+
+    def setUp(self):
+        logger = logging.getLogger("land_registry")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+        with open(DEFAULT_CORPUS) as f:
+            corpus = json.load(f)
+        self.postcodes = sorted(group["postcode"] for group in corpus["postcodes"])
+
+        sale_columns = import_lr_data.SALE_COLUMNS[:-import_lr_data.DERIVED_COLUMNS]
+        sales, epcs = [], []
+        for group in corpus["postcodes"]:
+            postcode = group["postcode"]
+            for sale in group["sales"]:
+                values = {
+                    "unique_id": sale["id"], "price_paid": "250000", "deed_date": "2020-01-01", "postcode": postcode,
+                    "property_type": "F", "new_build": "N", "estate_type": "L", "transaction_category": "A",
+                    "saon": sale["saon"], "paon": sale["paon"], "street": sale["street"],
+                }
+                sales.append([values.get(column, "") for column in sale_columns])
+            for epc in group["epcs"]:
+                addresses = [epc.get(f"address{n}") or "" for n in (1, 2, 3)]
+                # import_epc_data reads inspection dates as DD/MM/YYYY.
+                inspected = epc["inspection_date"] and date.fromisoformat(epc["inspection_date"]).strftime("%d/%m/%Y")
+                epcs.append([
+                    epc["lm_key"], *addresses, postcode, epc["property_type"], "", inspected or "",
+                    epc["total_floor_area"], epc["number_habitable_rooms"], "", "", ", ".join(filter(None, addresses)),
+                ])
+
+        command = import_lr_data.Command()
+        with CSVStream(csv_source(self, sale_columns, sales), on_progress=lambda n: None) as stream:
+            command.bulk_import(stream, 1000, command.copy_and_merge)
+        # Small batches, so later certificates for an address replace earlier ones in CurrentEPC.
+        with CSVStream(csv_source(self, EPC_CSV_COLUMNS, epcs), on_progress=lambda n: None) as stream:
+            import_stream(stream, 4)
+
+    def test_precision_and_recall(self):
+        command = populate_property_profiles.Command()
+        latest_sales = command.latest_sales(self.postcodes, local=False)
+        picked = set(latest_sales.values_list("pk", flat=True))
+        command.populate(latest_sales, locations={})
+        profiles = dict(PropertyProfile.objects.values_list("land_registry_sale_id", "epc_record_id"))
+
+        # Profiles are keyed on (postcode, paon, street), so only the latest sale of each building is matched.
+        groups = [
+            ([sale for sale in sales if sale.pk in picked], candidates)
+            for sales, candidates in load_corpus(DEFAULT_CORPUS)
+        ]
+        outcome, errors = score(groups, {pk: profiles.get(pk) for pk in picked})
+        precision, recall = precision_recall(outcome)
+
+        # CurrentEPC holds the latest certificate per address, as load_corpus picks them.
+        current = CurrentEPC.objects.filter(postcode__in=self.postcodes).values_list("lm_key", flat=True)
+        self.assertEqual(set(current), {epc.lm_key for _, candidates in groups for epc in candidates})
+        self.assertGreaterEqual(precision, 0.9, errors["matches"])
+        self.assertGreaterEqual(recall, 0.95, errors["matches"])
+
+
+def sale(address, postcode="LL30 2DG"):
+    clean, tokens, numbers = normalize_address(address)
+    return SimpleNamespace(
+        pk=address, postcode=postcode, full_address=address,
+        address_clean=clean, address_tokens=tokens, address_numbers=numbers,
+    )
+
+
+def epc(address, postcode="LL30 2DG"):
+    clean, tokens, numbers = normalize_address(address)
+    return SimpleNamespace(
+        lm_key=address, postcode=postcode, full_address=address,
+        address_clean=clean, address_tokens=tokens, address_numbers=numbers,
+    )
+
+
+class MatchPostcodeTests(SimpleTestCase):
+    """The scoring rules of the original per-sale matcher, which match_postcode must keep."""
+
+    def setUp(self):
+        logger = logging.getLogger("land_registry")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+    def match(self, address, candidates, postcode="LL30 2DG"):
+        """(matched address or None, audit record) for one sale."""
+        audit = []
+        [result] = match_postcode([sale(address, postcode)], candidates, workers=1, audit=audit)
+        return (result.full_address if result else None), audit[0]
+
+    def test_fast_path_takes_first_candidate_with_the_number(self):
+        candidates = [epc("FLAT 3, 14 STATION ROAD"), epc("14, HIGH STREET")]
+        matched, decision = self.match("14, HIGH STREET", candidates)
+        self.assertEqual(matched, "FLAT 3, 14 STATION ROAD")
+        self.assertEqual(decision.tier, "fast")
+
+    def test_fast_path_ignores_postcode_spacing_and_case(self):
+        matched, decision = self.match("14, HIGH STREET", [epc("14, HIGH STREET", "ll302dg")])
+        self.assertEqual((matched, decision.tier), ("14, HIGH STREET", "fast"))
+
+    def test_other_postcode_falls_through_to_fuzzy(self):
+        matched, decision = self.match("14, HIGH STREET", [epc("14, HIGH STREET", "LL30 2DH")])
+        self.assertEqual((matched, decision.tier), ("14, HIGH STREET", "fuzzy"))
+
+    def test_single_number_excludes_candidates_without_it(self):
+        matched, decision = self.match("7, PEN Y BRYN", [epc("PEN Y BRYN")])
+        self.assertIsNone(matched)
+        self.assertEqual(decision.tier, "none")
+
+    def test_boosts_lift_a_low_base_score(self):
+        # token_sort_ratio is 44.44; subset +15, overlap +10 and substring +20 take it over 70.
+        candidates = [epc("BRYN AFON"), epc("GLAN Y MOR, FFORDD PENRHYN, LLANDUDNO")]
+        matched, decision = self.match("GLAN Y MOR", candidates)
+        self.assertEqual(matched, "GLAN Y MOR, FFORDD PENRHYN, LLANDUDNO")
+        self.assertEqual(decision.tier, "fuzzy")
+        self.assertEqual(decision.boosts, ("token_subset", "token_overlap", "substring"))
+        self.assertEqual(decision.score, 89.44)
+
+    def test_below_fuzzy_threshold_is_unmatched(self):
+        # 53.85 plus the overlap boost is 63.85, and the raw strings are far apart.
+        matched, decision = self.match("ROSE COTTAGE", [epc("ROSE VILLA, MILL LANE")])
+        self.assertIsNone(matched)
+        self.assertEqual(decision.tier, "none")
+
+    def test_levenshtein_fallback(self):
+        # "12A" carries no number 12, so neither the fast path nor fuzzy may take it; the raw ratio is 96.77.
+        matched, decision = self.match("12, HIGH STREET", [epc("12A, HIGH STREET")])
+        self.assertEqual((matched, decision.tier), ("12A, HIGH STREET", "levenshtein"))
+        self.assertEqual(decision.score, 96.77)
+
+    def test_fuzzy_scores_cap_at_100_and_ties_go_to_the_first_candidate(self):
+        # 69.23 + 45 in boosts and an exact 100 both cap at 100.
+        matched, _ = self.match("MILL LANE", [epc("MILL LANE COTTAGE"), epc("MILL LANE")])
+        self.assertEqual(matched, "MILL LANE COTTAGE")
+        matched, _ = self.match("MILL LANE", [epc("MILL LANE"), epc("MILL LANE COTTAGE")])
+        self.assertEqual(matched, "MILL LANE")
+
+    def test_levenshtein_ties_go_to_the_first_candidate(self):
+        matched, _ = self.match("12, HIGH STREET", [epc("12B, HIGH STREET"), epc("12A, HIGH STREET")])
+        self.assertEqual(matched, "12B, HIGH STREET")
+
+    def test_exact_key_wins_before_any_scoring(self):
+        candidates = [epc("14, HIGH STREET"), epc("FLAT 1, 14 HIGH STREET")]
+        exact = sale("14, HIGH STREET")
+        exact.exact_epc = "FLAT 1, 14 HIGH STREET"
+        audit = []
+        [result] = match_postcode([exact], candidates, workers=1, audit=audit)
+        self.assertEqual((result.lm_key, audit[0].tier), ("FLAT 1, 14 HIGH STREET", "exact"))
+
+
+class PopulateFailedBatchTests(SimpleTestCase):
+    """Postcodes in a profile batch that fails to save are reported, so --incremental keeps them dirty."""
+
+    def setUp(self):
+        logger = logging.getLogger("land_registry")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+    def test_failed_batch_postcodes_are_returned(self):
+        command = populate_property_profiles.Command()
+        command.PROFILE_BATCH_SIZE = 2
+        sales = [SimpleNamespace(pk=n, postcode=postcode) for n, postcode in enumerate(
+            ["LL30 1AA", "LL30 1AA", "LL30 2BB", "LL30 3CC"]
+        )]
+        latest_sales = SimpleNamespace(iterator=lambda chunk_size: iter(sales))
+
+        with (
+            mock.patch.object(populate_property_profiles, "transaction"),
+            mock.patch.object(populate_property_profiles, "load_epc_candidates", return_value=[]),
+            mock.patch.object(
+                populate_property_profiles, "match_postcode",
+                side_effect=lambda sales, candidates, audit: [None] * len(sales),
+            ),
+            mock.patch.object(command, "build_profile", side_effect=lambda sale, epc: SimpleNamespace(
+                postcode=sale.postcode,
+            )),
+            mock.patch.object(
+                populate_property_profiles.PropertyProfile.objects, "bulk_create",
+                side_effect=[DatabaseError("deadlock detected"), None],
+            ),
+        ):
+            count, errors, failed = command.populate(latest_sales)
+
+        self.assertEqual((count, errors, failed), (2, 2, {"LL30 1AA"}))
+
+
+class HTTPGeocoderTests(SimpleTestCase):
+    """HTTPGeocoder against the fake_geocoder handler on a local port, with scripted failures and no database."""
+
+    def setUp(self):
+        logger = logging.getLogger("land_registry")
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+        # Each request takes the next outcome: 500, "timeout" (answer after the client gave up) or None (answer).
+        self.outcomes = []
+        self.requests = []
+        outcomes, requests = self.outcomes, self.requests
+
+        class Handler(FakeGeocoderHandler):
+            def fail(self, postcodes):
+                outcome = outcomes.pop(0) if outcomes else None
+                requests.append(postcodes)
+                if outcome == "timeout":
+                    time.sleep(0.5)
+                elif outcome == 500:
+                    self.reply(500, {"status": 500, "error": "Injected failure"})
+                return outcome is not None
+
+            def lookup(self, postcode):
+                return None if postcode.startswith("ZZ") else super().lookup(postcode)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+
+        # One worker, so requests (and outcomes) follow batch order.
+        self.geocoder = HTTPGeocoder(f"http://{host}:{port}", timeout=0.2, workers=1, ttl_days=1)
+        self.cached = {}
+        for patch in (
+            mock.patch.object(self.geocoder, "evict_expired"),
+            mock.patch.object(self.geocoder, "read_cache", return_value={}),
+            mock.patch.object(self.geocoder, "write_cache", side_effect=self.cached.update),
+            mock.patch.object(geocoding, "time"),  # no backoff between retries
+            mock.patch.object(geocoding, "tqdm"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_batches_retries_and_unmatched_postcodes(self):
+        known = [f"ll{10 + n // 100}{n % 10}{'ABCDEFGHIJ'[n // 10 % 10]}a" for n in range(240)]
+        unknown = [f"ZZ1 {n}AA" for n in range(10)]
+        # The first batch succeeds after a 500 and a timeout, the second fails every attempt.
+        self.outcomes.extend([500, "timeout", None, 500, 500, 500])
+
+        locations = self.geocoder.lookup(known + unknown)
+
+        self.assertEqual(self.requests, [100, 100, 100, 100, 100, 100, 50])
+        self.assertLessEqual(max(self.requests), BULK_LIMIT)
+        self.assertEqual(len(locations), 250)
+        first, second, last = sorted(locations)[:100], sorted(locations)[100:200], sorted(locations)[200:]
+        self.assertTrue(all(locations[postcode] for postcode in first + last[:40]))
+        self.assertTrue(all(locations[postcode] is None for postcode in second + last[40:]))
+        self.assertEqual(self.geocoder.stats, {"cached": 0, "fetched": 150, "not_found": 10, "failed": 100})
+        # Unknown postcodes are cached as None; the batch that failed is not cached at all.
+        self.assertEqual(sorted(self.cached), first + last)
@@ -1,9 +1,11 @@
 from django.urls import path
 from django.views.generic import TemplateView
 
-from .views import map_data_htmx_view
+from .views import map_data_view, profile_popup_view, profile_tile_view
 
 urlpatterns = [
     path("map/", TemplateView.as_view(template_name="map.html"), name="map"),
-    path("map-data/", map_data_htmx_view, name="map-data"),
+    path("map-data/", map_data_view, name="map-data"),
+    path("profile/<int:pk>/popup", profile_popup_view, name="profile-popup"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", profile_tile_view, name="profile-tile"),
 ]
\ No newline at end of file
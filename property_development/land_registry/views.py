@@ -1,91 +1,206 @@
+import math
+
+from django.conf import settings
 from django.contrib.gis.geos import Polygon
-from django.shortcuts import render
+from django.db import connection
+from django.db.models import FloatField, Func
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
 from django.utils.dateparse import parse_date
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_GET
 
-from .models import PropertyProfile
+from .caching import cache_key, cached
+from .metrics import SQ_FT_PER_SQ_M
+from .models import DatasetVersion, MapPoint
 
+# Zoom levels tiles are served for; past this the points are sparse enough to stop subdividing.
+MAX_TILE_ZOOM = 22
+# map-data sends individual points for up to this many profiles in view, and grid clusters beyond it.
+POINT_LIMIT = 2000
+# map-data widens each bbox to a grid of power-of-two-degree steps, about this many across, so views
+# a little way apart share a cached response.
+BBOX_STEPS = 8
+# Cluster cells per bbox step; cells align to a fixed grid, so clusters don't shift as the map pans.
+CLUSTER_CELLS_PER_STEP = 4
 
-def map_data_htmx_view(request):
-    bbox = request.GET.get('bbox')
+# The query parameters filter_points reads, which are part of every cache key.
+FILTER_PARAMS = ("min_price", "min_sqft", "max_sqft", "after_date")
 
-    if not bbox:
-        return render(request, "_property_points.html", {'too_many': False, 'features': [], 'count': 0})
+# Tile coordinate space, and the buffer (in those units) render_tile selects and clips points to, so markers
+# within it of an edge are drawn on both tiles.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+
+class Lat(Func):
+    template = "ST_Y(%(expressions)s::geometry)"
+    output_field = FloatField()
+
+
+class Lng(Func):
+    template = "ST_X(%(expressions)s::geometry)"
+    output_field = FloatField()
 
-    try:
-        sw_lng, sw_lat, ne_lng, ne_lat = map(float, bbox.split(','))
-        bbox_poly = Polygon.from_bbox((sw_lng, sw_lat, ne_lng, ne_lat))
-        bbox_poly.srid = 4326
-    except Exception:
-        return render(request, "_property_points.html", {'too_many': False, 'features': [], 'count': 0})
 
-    qs = PropertyProfile.objects.filter(location__within=bbox_poly).select_related('land_registry_sale')
+def filter_points(qs, params):
+    """Apply the map's filter parameters (min_price, min_sqft, max_sqft, after_date) to a MapPoint queryset.
 
-    # Optional filters
-    min_price = request.GET.get("min_price")
-    if min_price:
-        qs = qs.filter(land_registry_sale__price_paid__gte=int(min_price))
+    Values that don't parse are ignored, as an empty field would be.
+    """
+    min_price = parse_number(params.get("min_price"), int)
+    if min_price is not None:
+        qs = qs.filter(price_paid__gte=min_price)
 
-    min_sqft = request.GET.get("min_sqft")
-    if min_sqft:
-        qs = qs.filter(price_per_sq_ft__gte=float(min_sqft))
+    min_sqft = parse_number(params.get("min_sqft"), float)
+    if min_sqft is not None:
+        qs = qs.filter(price_per_sq_ft__gte=min_sqft)
 
-    max_sqft = request.GET.get("max_sqft")
-    if max_sqft:
-        qs = qs.filter(price_per_sq_ft__lte=float(max_sqft))
+    max_sqft = parse_number(params.get("max_sqft"), float)
+    if max_sqft is not None:
+        qs = qs.filter(price_per_sq_ft__lte=max_sqft)
 
-    after_date = request.GET.get("after_date")
+    after_date = params.get("after_date")
     if after_date:
         parsed_date = parse_date(after_date)
         if parsed_date:
-            qs = qs.filter(land_registry_sale__deed_date__gte=parsed_date)
+            qs = qs.filter(deed_date__gte=parsed_date)
 
-    count = qs.count()
+    return qs
 
-    if count > 2000:
-        return render(request, "_property_points.html", {'too_many': True, 'count': count})
 
-    features = []
-    for p in qs[:300]:
-        if not p.location or not p.land_registry_sale:
-            continue
-        sale = p.land_registry_sale
-        epc = p.epc_record
+def filter_key(params):
+    return tuple(params.get(name, "").strip() for name in FILTER_PARAMS)
 
-        address = f"{sale.full_address}, {sale.postcode}" or f"{sale.paon} {sale.street}, {sale.postcode}"
-        floor_area_sqm = (
-            f"{epc.total_floor_area:,.0f} m²" if epc and epc.total_floor_area else "N/A"
-        )
-        floor_area_sqft = (
-            f"{float(epc.total_floor_area) * 10.7639:,.0f} sqft"
-            if epc and epc.total_floor_area
-            else "N/A"
+
+def snap_bbox(west, south, east, north):
+    """Widen a bbox outwards to multiples of a power-of-two step; returns ((west, south, east, north), step)."""
+    step = 2.0 ** math.floor(math.log2(max(east - west, north - south, 1e-6) / BBOX_STEPS))
+    return (
+        math.floor(west / step) * step,
+        math.floor(south / step) * step,
+        math.ceil(east / step) * step,
+        math.ceil(north / step) * step,
+    ), step
+
+
+def parse_number(value, kind):
+    if not value:
+        return None
+    try:
+        return kind(value)
+    except ValueError:
+        return None
+
+
+def cluster_points(qs, cell_size):
+    """Group a filtered MapPoint queryset into grid cells of cell_size degrees, in one aggregate query.
+
+    Returns [lat, lng, count, median £/sqft] per occupied cell, lat/lng being the mean of its profiles.
+    """
+    sql, params = qs.values("location", "price_per_sq_ft").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT avg(ST_Y(points.location::geometry)), avg(ST_X(points.location::geometry)), count(*), "
+            f"percentile_cont(0.5) WITHIN GROUP (ORDER BY points.price_per_sq_ft) "
+            f"FROM ({sql}) AS points(location, price_per_sq_ft) "
+            f"GROUP BY ST_SnapToGrid(points.location::geometry, %s)",
+            [*params, cell_size],
         )
-        hab_rooms = epc.number_habitable_rooms if epc and epc.number_habitable_rooms else "N/A"
-        price_sqft = f"{p.price_per_sq_ft:,.0f}" if p.price_per_sq_ft else "N/A"
-        price_sqm = f"{p.price_per_sq_metre:,.0f}" if p.price_per_sq_metre else "N/A"
-
-        label = (
-            f"<div class='text-sm leading-tight'>"
-            f"<div class='font-bold text-base text-gray-900'>{address}</div>"
-            f"<div class='text-gray-700'>£{sale.price_paid:,} — {sale.deed_date}</div>"
-            f"<div>{p.estimated_num_bedrooms or '?'} beds "
-            f"— <span class='font-medium'>£{price_sqft}/sqft</span> "
-            f"— <span class='font-medium'>£{price_sqm}/m²</span></div>"
-            f"<div class='text-gray-600'>Area: {floor_area_sqft} — {floor_area_sqm}</div>"
-            f"<div class='text-gray-600'>Habitable Rooms: {hab_rooms}</div>"
-            f"</div>"
+        return cursor.fetchall()
+
+
+def tile_key(request, z, x, y):
+    """The tile's cache key, which is also its ETag: it changes with the filters and DatasetVersion."""
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return None
+    version = DatasetVersion.current(DatasetVersion.PROPERTY_PROFILES)
+    return cache_key("profile-tile", version, z, x, y, filter_key(request.GET))
+
+
+@require_GET
+# Clients may keep tiles but must revalidate them, so a rebuild shows up on the next request (as a 304 until then).
+@cache_control(public=True, no_cache=True)
+@etag(tile_key)
+def profile_tile_view(request, z, x, y):
+    """Map points in tile z/x/y as a Mapbox Vector Tile, one "profiles" layer, same filters as map-data."""
+    key = tile_key(request, z, x, y)
+    if key is None:
+        raise Http404("No such tile")
+
+    tile = cached(key, lambda: render_tile(z, x, y, request.GET), settings.MAP_DATA_CACHE_SECONDS)
+    return HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+
+
+def render_tile(z, x, y, params):
+    """The MVT bytes for tile z/x/y: the filtered map points within TILE_BUFFER of it, clipped to that buffer."""
+    sql, params = filter_points(MapPoint.objects.all(), params).values(
+        "id", "location", "price_per_sq_ft", "bedrooms", "price_paid",
+    ).query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        # Points are selected on a lat/lng box, the buffered tile in WGS84, using map_points_geometry_idx.
+        cursor.execute(
+            f"WITH bounds AS (SELECT ST_TileEnvelope(%s, %s, %s) AS envelope, "
+            f"ST_Transform(ST_TileEnvelope(%s, %s, %s, margin => %s), 4326) AS buffered) "
+            f"SELECT ST_AsMVT(tile, 'profiles', %s, 'geom', 'id') FROM ("
+            f"SELECT points.id, points.price_per_sq_ft, points.bedrooms, "
+            f"points.price_paid, ST_AsMVTGeom("
+            f"ST_Transform(points.location::geometry, 3857), bounds.envelope, %s, %s, true"
+            f") AS geom "
+            f"FROM ({sql}) AS points(id, location, price_per_sq_ft, bedrooms, price_paid), bounds "
+            f"WHERE points.location::geometry && bounds.buffered"
+            f") AS tile WHERE geom IS NOT NULL",
+            [z, x, y, z, x, y, TILE_BUFFER / TILE_EXTENT, TILE_EXTENT, TILE_EXTENT, TILE_BUFFER, *params],
         )
+        tile = cursor.fetchone()[0]
+    return bytes(tile or b"")
 
 
-        features.append({
-            'id': p.id,
-            'lat': p.location.y,
-            'lng': p.location.x,
-            'label': label,
-        })
+def map_data_view(request):
+    """Map points (land_registry_map_points) in the bbox as compact JSON, for the map page.
 
-    return render(request, "_property_points.html", {
-        'too_many': False,
-        'features': features,
-        'count': count
+    Returns {"points": [[id, lat, lng, price_per_sq_ft], ...], "clusters": []} when at most POINT_LIMIT
+    profiles match, otherwise {"points": [], "clusters": [[lat, lng, count, median £/sqft], ...]}.
+    The bbox is widened by snap_bbox and the response cached per snapped bbox, filters and DatasetVersion.
+    Popups are fetched separately, per marker, from profile_popup_view.
+    """
+    try:
+        sw_lng, sw_lat, ne_lng, ne_lat = map(float, request.GET["bbox"].split(","))
+        bbox, step = snap_bbox(sw_lng, sw_lat, ne_lng, ne_lat)
+    except (KeyError, ValueError, OverflowError):
+        return JsonResponse({"points": [], "clusters": []})
+
+    version = DatasetVersion.current(DatasetVersion.PROPERTY_PROFILES)
+    key = cache_key("map-data", version, bbox, filter_key(request.GET))
+    body = cached(key, lambda: map_data(bbox, step, request.GET), settings.MAP_DATA_CACHE_SECONDS)
+    return HttpResponse(body, content_type="application/json")
+
+
+def map_data(bbox, step, params):
+    """The map-data JSON body for a snapped bbox."""
+    bbox_poly = Polygon.from_bbox(bbox)
+    bbox_poly.srid = 4326
+    qs = filter_points(MapPoint.objects.filter(location__intersects=bbox_poly), params)
+
+    # One row past the limit tells us whether to cluster, without a separate count().
+    points = list(
+        qs.annotate(lat=Lat("location"), lng=Lng("location"))
+        .values_list("id", "lat", "lng", "price_per_sq_ft")[:POINT_LIMIT + 1]
+    )
+    if len(points) > POINT_LIMIT:
+        payload = {"points": [], "clusters": cluster_points(qs, step / CLUSTER_CELLS_PER_STEP)}
+    else:
+        payload = {"points": points, "clusters": []}
+    return JsonResponse(payload).content
+
+
+def profile_popup_view(request, pk):
+    """The popup for one map marker, rendered when it is opened."""
+    point = get_object_or_404(MapPoint, pk=pk)
+    floor_area = float(point.floor_area) if point.floor_area else None
+    return render(request, "_profile_popup.html", {
+        "point": point,
+        "floor_area_sqm": floor_area,
+        "floor_area_sqft": floor_area * float(SQ_FT_PER_SQ_M) if floor_area else None,
     })
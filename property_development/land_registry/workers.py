@@ -0,0 +1,47 @@
+"""Process-pool plumbing for the management commands.
+
+Spawned workers unpickle init_worker before Django is set up, so this module must not import models.
+"""
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.db import connections
+
+# Shared byte counter for a combined progress bar in the parent process.
+_progress = None
+
+
+def init_worker(progress=None):
+    global _progress
+    _progress = progress
+    django.setup()
+
+
+def report_progress(n):
+    with _progress.get_lock():
+        _progress.value += n
+
+
+def run_pool(workers, tasks, bar, label):
+    """Run each (fn, *args) in tasks on a pool of spawned workers and return the results as they finish.
+
+    Workers advance bar through report_progress; its postfix counts finished tasks under label.
+    Tasks are submitted in the order given.
+    """
+    context = multiprocessing.get_context("spawn")
+    progress = context.Value("q", 0)
+    results = []
+
+    # Workers open their own connections; don't leave one idling in the parent meanwhile.
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=init_worker, initargs=(progress,)
+    ) as pool:
+        pending = {pool.submit(fn, *args) for fn, *args in tasks}
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            results.extend(future.result() for future in done)
+            bar.update(progress.value - bar.n)
+            bar.set_postfix({label: f"{len(results)}/{len(tasks)}"})
+    return results
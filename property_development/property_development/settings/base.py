@@ -104,6 +104,20 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Import checkpoints for import_lr_data / import_epc_data --resume (a volume in docker-compose.prod.yml)
+IMPORT_STATE_DIR = Path(env("IMPORT_STATE_DIR", default="/state"))
+
+# HTTP geocoder for populate_property_profiles --geocoder http (any postcodes.io-compatible service)
+GEOCODER_URL = env("GEOCODER_URL", default="https://api.postcodes.io")
+GEOCODER_TIMEOUT = env.float("GEOCODER_TIMEOUT", default=10.0)
+GEOCODER_WORKERS = env.int("GEOCODER_WORKERS", default=8)
+GEOCODER_CACHE_TTL_DAYS = env.int("GEOCODER_CACHE_TTL_DAYS", default=90)
+
+# Cache backend from CACHE_URL (e.g. redis://redis:6379/1); per-process memory when unset
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+# How long a map-data response is kept; rebuilding the profiles invalidates them sooner (DatasetVersion)
+MAP_DATA_CACHE_SECONDS = env.int("MAP_DATA_CACHE_SECONDS", default=24 * 60 * 60)
+
 # Allow embedding from same-origin (useful for iframed PDFs)
 X_FRAME_OPTIONS = "SAMEORIGIN"
 
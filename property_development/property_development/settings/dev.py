@@ -3,3 +3,5 @@ from .base import *  # noqa: F403,F401
 DEBUG = True
 
 ALLOWED_HOSTS += ["*"]  # caution: dev only
+
+IMPORT_STATE_DIR = Path(env("IMPORT_STATE_DIR", default=str(BASE_DIR / "state")))